@@ -2,7 +2,7 @@ import uvicorn
 from fastapi import FastAPI
 from starlette.responses import RedirectResponse
 
-from clio import common_exception_handlers
+from clio import common_exception_handlers, http_client_lifespan, metrics_router
 from clio.web.middleware.middleware import HttpMiddleware, RawContextMiddleware
 from example.controller.test_controller import test_api_router
 
@@ -10,8 +10,10 @@ from example.controller.test_controller import test_api_router
 def create_app():
     application = FastAPI(
         exception_handlers=common_exception_handlers(),
+        lifespan=http_client_lifespan,
     )
     application.include_router(test_api_router)
+    application.include_router(metrics_router())
     # middlewares,后加的先执行
     application.add_middleware(HttpMiddleware)
     application.add_middleware(RawContextMiddleware)
@@ -0,0 +1,137 @@
+"""
+对比common_exception_handlers旧实现(pydantic模型+JSONResponse, 每个错误都同步输出带堆栈的日志)
+与新实现(直接编码bytes, 缓存404响应体, 采样日志)在错误风暴下的吞吐量
+
+日志写入临时目录中的文件, 模拟线上的同步文件日志
+运行: python -m benchmarks.error_handler_benchmark --requests 3000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.exceptions import RequestValidationError
+from starlette.responses import JSONResponse
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from clio import (
+    BusinessException,
+    HttpResponse,
+    Log,
+    common_exception_handlers,
+    default_logger,
+    file_handler,
+    hack_json,
+)
+
+
+def legacy_exception_handlers():
+    """改造前的common_exception_handlers, 去掉了指标"""
+    exception_handlers = {}
+
+    async def not_found_error_handler(request, exc):
+        msg = f"404 not found: {request.url}"
+        Log.error(msg, exc_info=False)
+        return JSONResponse(
+            status_code=HTTP_404_NOT_FOUND,
+            content=HttpResponse.failure(HTTP_404_NOT_FOUND, msg),
+        )
+
+    exception_handlers[404] = not_found_error_handler
+
+    async def request_validation_error(request, exc: RequestValidationError):
+        error_msg = str(exc)
+        Log.error(f"request validation error: {error_msg}")
+        return JSONResponse(
+            status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+            content=HttpResponse.failure(HTTP_422_UNPROCESSABLE_ENTITY, error_msg),
+        )
+
+    exception_handlers[RequestValidationError] = request_validation_error
+
+    async def business_error_handler(request, exc: BusinessException):
+        Log.error(f"business error: {exc}")
+        return JSONResponse(
+            status_code=HTTP_200_OK,
+            content=HttpResponse.failure(exc.code, exc.message),
+        )
+
+    exception_handlers[BusinessException] = business_error_handler
+    return exception_handlers
+
+
+def create_app(exception_handlers) -> FastAPI:
+    application = FastAPI(exception_handlers=exception_handlers)
+
+    @application.get("/business")
+    async def business():
+        raise BusinessException(1001, "余额不足")
+
+    @application.get("/validation")
+    async def validation(page: int):
+        return page
+
+    return application
+
+
+async def run(name: str, app: FastAPI, paths, args) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://testserver"
+    ) as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                await client.get(paths(i))
+
+        await asyncio.gather(*[one(i) for i in range(args.concurrency)])
+        throughputs = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            await asyncio.gather(*[one(i) for i in range(args.requests)])
+            throughputs.append(args.requests / (time.perf_counter() - start))
+    print(f"{name:<24}: median {statistics.median(throughputs):8.0f} req/s")
+    return statistics.median(throughputs)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    default_logger.handlers.clear()
+    default_logger.setLevel(logging.INFO)
+    log_dir = tempfile.mkdtemp(prefix="clio-error-bench-")
+    default_logger.addHandler(file_handler(log_dir, logging_level=logging.INFO))
+    # 旧实现依赖hack_json才能序列化HttpResponse
+    hack_json()
+
+    legacy = create_app(legacy_exception_handlers())
+    current = create_app(common_exception_handlers())
+    scenarios = (
+        ("404 scan", lambda i: f"/wp-admin/{i}.php"),
+        ("business error", lambda i: "/business"),
+        ("validation error", lambda i: "/validation?page=x"),
+    )
+    for title, paths in scenarios:
+        before = await run(f"{title} before", legacy, paths, args)
+        after = await run(f"{title} after", current, paths, args)
+        print(f"{'':<24}  speedup {after / before:.2f}x")
+    print(f"logs: {log_dir}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
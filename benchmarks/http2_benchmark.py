@@ -0,0 +1,116 @@
+"""
+对比HTTP/1.1与HTTP/2连接池在高并发下的延迟与连接数
+
+需要安装: pip install httpx[http2] hypercorn
+运行: python -m benchmarks.http2_benchmark --requests 2000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+from clio.web.http_client import HttpClientPool, http_invoke, http_invoke_many
+
+connections: set = set()
+
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    # 每个tcp连接的客户端端口不同, 以此统计连接数
+    connections.add(scope["client"])
+    await asyncio.sleep(0.005)
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": b'{"ok":true}'})
+
+
+async def run(pool_name: str, url: str, total: int, concurrency: int):
+    connections.clear()
+    latencies = []
+
+    async def timed(**kwargs):
+        start = time.perf_counter()
+        response = await http_invoke(**kwargs)
+        latencies.append(time.perf_counter() - start)
+        return response
+
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await timed(url=url, pool_name=pool_name, verbose=False)
+
+    results = await asyncio.gather(*[one() for _ in range(total)])
+    elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in results)
+    latencies.sort()
+    print(
+        f"{pool_name:>6}: {total / elapsed:8.0f} req/s, "
+        f"p50 {latencies[len(latencies) // 2] * 1000:6.2f}ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f}ms, "
+        f"mean {statistics.mean(latencies) * 1000:6.2f}ms, "
+        f"connections {len(connections)}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{args.port}"]
+    config.loglevel = "WARNING"
+    config.backlog = 4096
+    config.keep_alive_timeout = 60
+    # hypercorn默认每个连接处理1000个请求后关闭, 会打断HTTP/2连接上正在进行的请求
+    config.keep_alive_max_requests = args.requests * 2
+    config.h2_max_concurrent_streams = args.concurrency
+    shutdown = asyncio.Event()
+    server = asyncio.ensure_future(serve(app, config, shutdown_trigger=shutdown.wait))
+    await asyncio.sleep(0.5)
+
+    url = f"http://127.0.0.1:{args.port}/"
+    # clio.logger会把root logger设置为DEBUG, 压测时关闭httpx, h2等库的日志
+    logging.getLogger().setLevel(logging.WARNING)
+    HttpClientPool.configure(
+        "http1",
+        max_connections=args.concurrency,
+        max_keepalive_connections=args.concurrency,
+    )
+    # 明文h2c, 直接使用HTTP/2 prior knowledge
+    HttpClientPool.configure(
+        "http2",
+        max_connections=args.concurrency,
+        max_keepalive_connections=args.concurrency,
+        http2=True,
+        http1=False,
+    )
+    for pool_name in ("http1", "http2"):
+        # 预热, 建立连接
+        await http_invoke_many(
+            [{"url": url, "pool_name": pool_name}] * 10, verbose=False
+        )
+        await run(pool_name, url, args.requests, args.concurrency)
+
+    await HttpClientPool.close()
+    shutdown.set()
+    await server
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+"""
+对比object_to_json旧实现(jsonable_encoder逐个对象递归)与按类型缓存编码函数的新实现,
+数据为嵌套的pydantic模型与dataclass列表
+
+运行: python -m benchmarks.json_encoder_benchmark --rows 200 --number 20
+"""
+
+import argparse
+import dataclasses
+import datetime
+import logging
+import timeit
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from clio import HttpResponse, default_logger, object_to_json
+from clio.pydantics import BaseModel
+from clio.utils import json_util
+
+
+def legacy_object_to_json(obj, include=None, exclude=None):
+    """改造前的object_to_json"""
+    if obj is None:
+        return None
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if hasattr(obj, "to_json"):
+        return obj.to_json()
+    return jsonable_encoder(obj, include=include, exclude=exclude)
+
+
+def uncached_default(obj):
+    """按类型缓存之前的序列化default, 每个对象都重新判断类型"""
+    cls = type(obj)
+    if getattr(cls, "to_dict", None) is not None:
+        return obj.to_dict()
+    if getattr(cls, "to_json", None) is not None:
+        return obj.to_json()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(by_alias=True)
+    if getattr(obj, "_mapping", None) is not None:
+        return dict(obj._mapping)
+    if hasattr(obj, "_sa_instance_state"):
+        return {k: v for k, v in obj.__dict__.items() if not k.startswith("_sa")}
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    return jsonable_encoder(obj)
+
+
+@dataclass
+class Sku:
+    code: str
+    price: Decimal
+    stock: int
+
+
+class Item(BaseModel):
+    name: str
+    quantity: int
+    sku: Sku
+
+
+class Order(BaseModel):
+    id: int
+    status: str
+    created_at: datetime.datetime
+    items: List[Item]
+    extra: dict
+
+
+def create_orders(count: int) -> List[Order]:
+    now = datetime.datetime(2024, 1, 1)
+    return [
+        Order(
+            id=i,
+            status="paid",
+            created_at=now,
+            items=[
+                Item(
+                    name=f"item-{j}",
+                    quantity=j,
+                    sku=Sku(f"sku-{i}-{j}", Decimal("9.90"), 100),
+                )
+                for j in range(5)
+            ],
+            extra={"source": "app", "skus": [Sku("gift", Decimal("0"), 1)]},
+        )
+        for i in range(count)
+    ]
+
+
+def bench(name: str, func, number: int) -> float:
+    cost = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e3
+    print(f"{name:<46} {cost:8.2f} ms")
+    return cost
+
+
+def compare(title: str, before_func, after_func, number: int):
+    before = bench(f"{title} before", before_func, number)
+    after = bench(f"{title} after", after_func, number)
+    print(f"{'':<46} {before / after:8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    default_logger.setLevel(logging.WARNING)
+
+    orders = create_orders(args.rows)
+    response = HttpResponse.success(orders)
+    option = orjson.OPT_NON_STR_KEYS
+
+    compare(
+        "object_to_json(list)",
+        lambda: legacy_object_to_json(orders),
+        lambda: object_to_json(orders),
+        args.number,
+    )
+    compare(
+        "object_to_json(HttpResponse)",
+        lambda: jsonable_encoder(response),
+        lambda: object_to_json(response),
+        args.number,
+    )
+    include = {"id", "items"}
+    compare(
+        "object_to_json(model, include)",
+        lambda: [legacy_object_to_json(o, include=include) for o in orders],
+        lambda: [object_to_json(o, include=include) for o in orders],
+        args.number,
+    )
+    compare(
+        "orjson.dumps default (type cache)",
+        lambda: orjson.dumps(response, default=uncached_default, option=option),
+        lambda: orjson.dumps(
+            response, default=json_util._encode_default, option=option
+        ),
+        args.number,
+    )
+
+
+if __name__ == "__main__":
+    main()
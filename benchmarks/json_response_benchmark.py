@@ -0,0 +1,119 @@
+"""
+对比返回大列表时FastAPI默认的jsonable_encoder+JSONResponse与FastJSONResponse的吞吐量
+
+运行: python -m benchmarks.json_response_benchmark --rows 1000 --requests 500 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import statistics
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+import httpx
+from fastapi import FastAPI
+
+from clio import HttpResponse, JsonSerializer, default_logger
+from clio.pydantics import BaseModel
+from clio.web import FastJSONResponse
+
+
+@dataclass
+class OrderItem:
+    sku: str
+    quantity: int
+    price: Decimal
+
+
+class Order(BaseModel):
+    id: int
+    user_id: int
+    status: str
+    amount: float
+    remark: str
+    created_at: datetime.datetime
+    items: list
+
+
+def create_rows(count: int) -> list:
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    return [
+        Order(
+            id=i,
+            user_id=i % 97,
+            status="paid",
+            amount=i * 1.5,
+            remark="订单备注" * 4,
+            created_at=now + datetime.timedelta(seconds=i),
+            items=[OrderItem(f"sku-{i}-{j}", j, Decimal("9.90")) for j in range(3)],
+        )
+        for i in range(count)
+    ]
+
+
+def create_app(rows: list) -> FastAPI:
+    application = FastAPI()
+
+    @application.get("/legacy")
+    async def legacy():
+        return HttpResponse.success(rows)
+
+    @application.get("/fast")
+    async def fast():
+        return FastJSONResponse(HttpResponse.success(rows))
+
+    return application
+
+
+async def run(name: str, client: httpx.AsyncClient, path: str, args) -> float:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with semaphore:
+            response = await client.get(path)
+            assert response.status_code == 200
+
+    await asyncio.gather(*[one() for _ in range(args.concurrency)])
+    throughputs = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(args.requests)])
+        throughputs.append(args.requests / (time.perf_counter() - start))
+    print(
+        f"{name:>8}: median {statistics.median(throughputs):8.0f} req/s, "
+        f"best {max(throughputs):8.0f} req/s"
+    )
+    return statistics.median(throughputs)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    default_logger.setLevel(logging.WARNING)
+
+    rows = create_rows(args.rows)
+    print(f"json backend: {JsonSerializer.backend()}, rows: {args.rows}")
+    transport = httpx.ASGITransport(app=create_app(rows))
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://testserver"
+    ) as client:
+        legacy = (await client.get("/legacy")).json()
+        fast = (await client.get("/fast")).json()
+        assert len(legacy["data"]) == len(fast["data"])
+        assert legacy["data"][0].keys() == fast["data"][0].keys()
+        before = await run("before", client, "/legacy", args)
+        after = await run("after", client, "/fast", args)
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+对比基于BaseHTTPMiddleware的旧HttpMiddleware与纯ASGI实现的吞吐量
+
+在example应用上通过httpx.ASGITransport直接调用ASGI应用, 不经过网络, 只比较中间件本身的开销
+运行: python -m benchmarks.middleware_benchmark --requests 5000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.requests import Request
+from starlette.responses import Response
+
+from clio import TraceContext, common_exception_handlers, default_logger
+from clio.context.trace import trace_context
+from clio.web.middleware.middleware import HttpMiddleware, RawContextMiddleware
+from example.controller.test_controller import test_api_router
+
+
+class LegacyHttpMiddleware(BaseHTTPMiddleware):
+    """改造前的HttpMiddleware"""
+
+    async def dispatch(
+        self, request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        trace_id = trace_context.trace_id()
+        response = await call_next(request)
+        if trace_id:
+            response.headers.update({TraceContext.X_TRACE_ID: trace_id})
+        return response
+
+
+def create_app(middleware) -> FastAPI:
+    application = FastAPI(exception_handlers=common_exception_handlers())
+    application.include_router(test_api_router)
+    application.add_middleware(middleware)
+    application.add_middleware(RawContextMiddleware)
+    return application
+
+
+async def run(name: str, app: FastAPI, total: int, concurrency: int, rounds: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://testserver"
+    ) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                response = await client.get("/test/test")
+                assert response.status_code == 200
+                assert TraceContext.X_TRACE_ID in response.headers
+
+        # 预热
+        await asyncio.gather(*[one() for _ in range(concurrency)])
+        throughputs = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await asyncio.gather(*[one() for _ in range(total)])
+            throughputs.append(total / (time.perf_counter() - start))
+    print(
+        f"{name:>8}: median {statistics.median(throughputs):8.0f} req/s, "
+        f"best {max(throughputs):8.0f} req/s"
+    )
+    return statistics.median(throughputs)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # clio.logger会把root logger设置为DEBUG, 压测时关闭日志输出
+    logging.getLogger().setLevel(logging.WARNING)
+    default_logger.setLevel(logging.WARNING)
+
+    before = await run(
+        "before",
+        create_app(LegacyHttpMiddleware),
+        args.requests,
+        args.concurrency,
+        args.rounds,
+    )
+    after = await run(
+        "after",
+        create_app(HttpMiddleware),
+        args.requests,
+        args.concurrency,
+        args.rounds,
+    )
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
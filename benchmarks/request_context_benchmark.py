@@ -0,0 +1,151 @@
+"""
+对比RequestContext旧实现(读写Request.state)与新实现(__slots__字段)在一次请求中的开销
+
+模拟一次请求: 创建上下文, 解析x-trace-id, 更新一次trace_extra, 读写几个自定义数据, 输出若干条日志(读取trace字段)
+
+运行: python -m benchmarks.request_context_benchmark --number 20000 --logs 20
+"""
+
+import argparse
+import timeit
+from contextvars import ContextVar
+from typing import Any, Dict
+
+from starlette.datastructures import State
+from starlette.requests import Request
+
+from clio.context import (
+    RequestContext,
+    TraceContext,
+    TraceFields,
+    request_context_manager,
+)
+from clio.context.trace import trace_context
+
+
+class LegacyRequestContext:
+    """改造前的实现"""
+
+    def __init__(self, request: Request):
+        self._request = request
+
+    def get(self, key: str, default: Any = None) -> Any:
+        state: State = self._request.state
+        if hasattr(state, key):
+            return getattr(state, key, default)
+        return default
+
+    def set(self, key: str, value: Any):
+        state = self._request.state
+        setattr(state, key, value)
+
+
+_legacy_storage: ContextVar[LegacyRequestContext] = ContextVar("legacy_context")
+
+
+def _legacy_has_request_context() -> bool:
+    return _legacy_storage.get(None) is not None
+
+
+def _legacy_request_context() -> LegacyRequestContext:
+    return _legacy_storage.get(None)
+
+
+class LegacyTraceContext:
+    """改造前的TraceContext读写方式"""
+
+    def parse_trace_id(self, trace_id: str, context):
+        m = {TraceContext.X_TRACE_ID: trace_id}
+        extra_m = context.get(TraceContext.TRACE_EXTRA, {})
+        extra_m.update(m)
+        context.set(TraceContext.TRACE_EXTRA, extra_m)
+        context.set(TraceContext.TRACE_FIELDS, None)
+
+    def trace_id(self):
+        if _legacy_has_request_context():
+            extra = _legacy_request_context().get("__trace_extra", {})
+            return extra.get(TraceContext.X_TRACE_ID, "")
+        return ""
+
+    def trace_extra_update(self, data: Dict[str, Any]):
+        if _legacy_has_request_context():
+            ctx = _legacy_request_context()
+            trace_extra = ctx.get("__trace_extra", {})
+            trace_extra.update(data)
+            ctx.set("__trace_extra", trace_extra)
+            ctx.set(TraceContext.TRACE_FIELDS, None)
+
+    def trace_fields(self):
+        if not _legacy_has_request_context():
+            return TraceFields()
+        ctx = _legacy_request_context()
+        fields = ctx.get(TraceContext.TRACE_FIELDS)
+        if fields is None:
+            fields = TraceFields(ctx.get("__trace_extra", {}))
+            ctx.set(TraceContext.TRACE_FIELDS, fields)
+        return fields
+
+
+_SCOPE = {"type": "http", "method": "GET", "path": "/", "headers": []}
+
+
+def legacy_request(logs: int):
+    tc = LegacyTraceContext()
+    ctx = LegacyRequestContext(Request(_SCOPE))
+    tc.parse_trace_id("gateway-123456", ctx)
+    token = _legacy_storage.set(ctx)
+    try:
+        tc.trace_extra_update({"user_id": 1})
+        ctx.set("user", "u1")
+        ctx.get("user")
+        ctx.get("missing")
+        for _ in range(logs):
+            tc.trace_fields()
+        tc.trace_id()
+    finally:
+        _legacy_storage.reset(token)
+
+
+def current_request(logs: int):
+    ctx = RequestContext(Request(_SCOPE))
+    ctx.update_trace_extra({TraceContext.X_TRACE_ID: "gateway-123456"})
+    with request_context_manager(ctx):
+        trace_context.trace_extra_update({"user_id": 1})
+        ctx.set("user", "u1")
+        ctx.get("user")
+        ctx.get("missing")
+        for _ in range(logs):
+            trace_context.trace_fields()
+        trace_context.trace_id()
+
+
+def bench(name: str, func, number: int) -> float:
+    cost = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+    print(f"{name:<42} {cost:8.0f} ns")
+    return cost
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument(
+        "--logs", type=int, default=20, help="每个请求读取trace字段的次数"
+    )
+    args = parser.parse_args()
+
+    for logs in (0, args.logs):
+        before = bench(
+            f"request with {logs} logs before",
+            lambda: legacy_request(logs),
+            args.number,
+        )
+        after = bench(
+            f"request with {logs} logs after",
+            lambda: current_request(logs),
+            args.number,
+        )
+        print(f"{'':<42} {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+对比一次性返回HttpResponse.success(list)与HttpResponse.stream(iterator)的内存峰值
+
+直接调用ASGI应用并丢弃响应体(httpx.ASGITransport会把整个响应体保存在内存中), 用tracemalloc统计峰值
+运行: python -m benchmarks.streaming_response_benchmark --rows 10000 50000
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import tracemalloc
+
+from fastapi import FastAPI
+
+from clio import HttpResponse, default_logger
+from clio.web import FastJSONResponse
+
+
+def rows(count: int):
+    created_at = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        yield {"id": i, "name": f"row-{i}", "created_at": created_at}
+
+
+def create_app() -> FastAPI:
+    application = FastAPI()
+
+    @application.get("/list")
+    async def export_list(n: int):
+        return FastJSONResponse(HttpResponse.success(list(rows(n))))
+
+    @application.get("/stream")
+    async def export_stream(n: int):
+        return HttpResponse.stream(rows(n))
+
+    return application
+
+
+async def measure(app: FastAPI, path: str, count: int):
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": f"n={count}".encode(),
+        "headers": [],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 10000),
+    }
+    received = False
+    size = 0
+
+    async def receive():
+        nonlocal received
+        if received:
+            # 客户端不断开, StreamingResponse会一直等待http.disconnect
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    tracemalloc.start()
+    await app(scope, receive, send)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    default_logger.setLevel(logging.WARNING)
+
+    app = create_app()
+    # 预热, 排除导入与首次编译的内存
+    await measure(app, "/stream", 10)
+    await measure(app, "/list", 10)
+    for count in args.rows:
+        for path in ("/list", "/stream"):
+            size, peak = await measure(app, path, count)
+            print(
+                f"{path:>8} rows={count:<8} body={size / 1024 / 1024:7.2f} MB "
+                f"peak={peak / 1024 / 1024:7.2f} MB"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+对比TraceContext.parse_trace_id与trace id生成的旧实现与新实现的单次耗时
+
+运行: python -m benchmarks.trace_id_benchmark --number 200000
+"""
+
+import argparse
+import base64
+import random
+import struct
+import time
+import timeit
+
+from clio.context import RequestContext, TraceContext
+
+
+class LegacyTraceContext(TraceContext):
+    """改造前的实现"""
+
+    def parse_trace_id(self, scope, context):
+        raw_headers = list(scope.get("headers", []))
+        headers = {}
+        for key, value in raw_headers:
+            headers[key.decode("latin-1")] = value.decode("latin-1")
+        trace_id = headers.get(TraceContext.X_TRACE_ID, "")
+        if not trace_id:
+            unique_id = self.create_unique_id()
+            trace_id = f"{self.app_name}-{unique_id}"
+        m = {TraceContext.X_TRACE_ID: trace_id}
+        extra_m = context.get(TraceContext.TRACE_EXTRA, {})
+        extra_m.update(m)
+        context.set(TraceContext.TRACE_EXTRA, extra_m)
+        context.set(TraceContext.TRACE_FIELDS, None)
+        return m
+
+    def create_unique_id(self):
+        timestamp_bigint = int(time.time_ns())
+        random_long = random.randint(-9223372036854775808, 9223372036854775807)
+        buf = bytearray(16)
+        struct.pack_into(">q", buf, 0, timestamp_bigint)
+        struct.pack_into(">q", buf, 8, random_long)
+        result = base64.b64encode(buf).decode("ascii")
+        return result.replace("+", "-").replace("/", "_").rstrip("=")
+
+
+# 浏览器经过网关后常见的header数量
+_BROWSER_HEADERS = [
+    (b"host", b"api.example.com"),
+    (b"user-agent", b"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) Chrome/120.0"),
+    (b"accept", b"application/json, text/plain, */*"),
+    (b"accept-language", b"zh-CN,zh;q=0.9,en;q=0.8"),
+    (b"accept-encoding", b"gzip, deflate, br"),
+    (b"content-type", b"application/json"),
+    (b"origin", b"https://www.example.com"),
+    (b"referer", b"https://www.example.com/orders"),
+    (b"cookie", b"session=" + b"a" * 200),
+    (b"authorization", b"Bearer " + b"t" * 300),
+    (b"x-forwarded-for", b"10.0.0.1, 10.0.0.2"),
+    (b"x-forwarded-proto", b"https"),
+    (b"x-real-ip", b"10.0.0.1"),
+    (b"connection", b"keep-alive"),
+]
+
+
+def bench(name: str, func, number: int) -> float:
+    cost = min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+    print(f"{name:<42} {cost:8.0f} ns")
+    return cost
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    legacy = LegacyTraceContext("clio")
+    current = TraceContext("clio")
+    without_id = {"headers": _BROWSER_HEADERS}
+    with_id = {"headers": _BROWSER_HEADERS + [(b"x-trace-id", b"gateway-123456")]}
+
+    for title, scope in (("no x-trace-id", without_id), ("with x-trace-id", with_id)):
+        before = bench(
+            f"parse_trace_id {title} before",
+            lambda: legacy.parse_trace_id(scope, RequestContext(None)),
+            args.number,
+        )
+        after = bench(
+            f"parse_trace_id {title} after",
+            lambda: current.parse_trace_id(scope, RequestContext(None)),
+            args.number,
+        )
+        print(f"{'':<42} {before / after:8.2f}x")
+    before = bench("create_unique_id before", legacy.create_unique_id, args.number)
+    after = bench("create_unique_id after", current.create_unique_id, args.number)
+    print(f"{'':<42} {before / after:8.2f}x")
+
+    ids = [current.create_unique_id() for _ in range(100000)]
+    assert len(set(ids)) == len(ids), "duplicate ids"
+    assert ids == sorted(ids), "ids are not sortable"
+
+
+if __name__ == "__main__":
+    main()
@@ -3,5 +3,6 @@ from .logger import *  # isort:skip
 from .pydantics import *  # isort:skip
 from .workspace import *  # isort:skip
 from .utils import *  # isort:skip
+from .metrics import *  # isort:skip
 from .web import *  # isort:skip
 from .decorators import *  # isort:skip
@@ -4,9 +4,36 @@ from .globals import (
     request,
     request_context,
     request_context_manager,
+    request_context_or_none,
     request_context_update,
 )
-from .trace_context import TraceContext
+from .propagation import (
+    ContextExecutor,
+    ContextSnapshot,
+    DetachedRequestContext,
+    capture_context,
+    run_in_threadpool_with_context,
+    spawn_with_context,
+)
+from .span import (
+    TRACEPARENT,
+    TRACESTATE,
+    Span,
+    current_span,
+    format_traceparent,
+    inject_trace_headers,
+    parse_traceparent,
+    span,
+    start_span,
+    tracing_enabled,
+)
+from .span_exporter import (
+    BatchSpanProcessor,
+    JsonLinesSpanExporter,
+    SpanExporter,
+    Tracer,
+)
+from .trace_context import TraceContext, TraceFields
 
 __all__ = [
     "request_context",
@@ -16,6 +43,31 @@ __all__ = [
     "request",
     "RequestContext",
     "request_context_update",
+    "request_context_or_none",
     "trace",
     "TraceContext",
+    "TraceFields",
+    # 向线程池/进程池/后台task传递trace
+    "ContextSnapshot",
+    "DetachedRequestContext",
+    "ContextExecutor",
+    "capture_context",
+    "run_in_threadpool_with_context",
+    "spawn_with_context",
+    # span
+    "TRACEPARENT",
+    "TRACESTATE",
+    "Span",
+    "span",
+    "start_span",
+    "current_span",
+    "parse_traceparent",
+    "format_traceparent",
+    "inject_trace_headers",
+    "tracing_enabled",
+    # span exporter
+    "SpanExporter",
+    "JsonLinesSpanExporter",
+    "BatchSpanProcessor",
+    "Tracer",
 ]
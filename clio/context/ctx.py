@@ -1,39 +1,114 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Dict, Optional
 
-from starlette.datastructures import State
 from starlette.requests import Request
 
+X_TRACE_ID = "x-trace-id"
+# 兼容通过get/set读写trace数据的旧用法, 实际保存在RequestContext的字段中
+TRACE_EXTRA_KEY = "__trace_extra"
+TRACE_FIELDS_KEY = "__trace_fields"
+
+_MISSING = object()
+
 
 class RequestContext:
-    def __init__(self, request: Request):
+    """
+    请求上下文, 数据保存在自己的字段中
+    trace_id, trace_extra, trace_fields 是日志每次都会读取的字段, 直接作为属性访问, 不再写入Request.state
+    其它数据保存在_data中, 通过get/set/remove访问, 有Request时同时写入/删除request.state,
+    get在_data中没有时读取request.state, 与直接读写request.state的代码兼容
+    copy是写时复制的, 复制后任何一方第一次修改时才真正复制数据, 但只复制一层:
+    list/dict等可变值(如http调用耗时列表)仍然共享, 需要隔离时set一个新对象,
+    有Request时两个上下文的set都会写入同一个request.state
+    """
+
+    __slots__ = (
+        "_request",
+        "trace_id",
+        "trace_extra",
+        "trace_fields",
+        "_data",
+        "_shared",
+    )
+
+    def __init__(self, request: Optional[Request]):
         self._request = request
+        self.trace_id = ""
+        self.trace_extra: Dict[str, Any] = {}
+        # trace_extra的只读快照(TraceFields), trace_extra修改后置为None, 由TraceContext重新生成
+        self.trace_fields = None
+        self._data: Dict[str, Any] = {}
+        self._shared = False
+
+    def _unshare(self):
+        self._data = dict(self._data)
+        self.trace_extra = dict(self.trace_extra)
+        self._shared = False
 
     def get(self, key: str, default: Any = None) -> Any:
         """Get value from context."""
-        state: State = self._request.state
-        if hasattr(state, key):
-            return getattr(state, key, default)
-        return default
+        if key == TRACE_EXTRA_KEY:
+            return self.trace_extra
+        if key == TRACE_FIELDS_KEY:
+            return self.trace_fields
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            if self._request is None:
+                return default
+            return getattr(self._request.state, key, default)
+        return value
 
     def set(self, key: str, value: Any):
         """Set value in context."""
-        state = self._request.state
-        setattr(state, key, value)
+        if key == TRACE_EXTRA_KEY:
+            if self._shared:
+                self._unshare()
+            self.trace_extra = dict(value)
+            self.trace_id = self.trace_extra.get(X_TRACE_ID, "")
+            self.trace_fields = None
+        elif key == TRACE_FIELDS_KEY:
+            self.trace_fields = value
+        else:
+            if self._shared:
+                self._unshare()
+            self._data[key] = value
+            if self._request is not None:
+                setattr(self._request.state, key, value)
 
     def remove(self, key: str) -> Any:
         """Remove value from context and return the old value."""
-        state: State = self._request.state
-        if hasattr(state, key):
-            return delattr(state, key)
-        return None
+        if self._shared:
+            self._unshare()
+        value = self._data.pop(key, None)
+        if self._request is not None:
+            state = self._request.state
+            if hasattr(state, key):
+                if value is None:
+                    value = getattr(state, key)
+                delattr(state, key)
+        return value
+
+    def update_trace_extra(self, data: Dict[str, Any]):
+        """更新trace字段, 原地修改, 不需要重新读写整个dict"""
+        if self._shared:
+            self._unshare()
+        self.trace_extra.update(data)
+        trace_id = data.get(X_TRACE_ID)
+        if trace_id is not None:
+            self.trace_id = trace_id
+        self.trace_fields = None
 
     @property
     def request(self) -> Request:
         return self._request
 
     def copy(self) -> RequestContext:
-        return self.__class__(
-            request=self._request,
-        )
+        ctx = self.__class__.__new__(self.__class__)
+        ctx._request = self._request
+        ctx.trace_id = self.trace_id
+        ctx.trace_extra = self.trace_extra
+        ctx.trace_fields = self.trace_fields
+        ctx._data = self._data
+        ctx._shared = self._shared = True
+        return ctx
@@ -1,6 +1,6 @@
 from contextlib import contextmanager
 from contextvars import ContextVar, Token
-from typing import Any, Dict, Iterator
+from typing import Any, Dict, Iterator, Optional
 
 from starlette.requests import Request
 
@@ -32,6 +32,11 @@ def has_request_context() -> bool:
     return _request_scope_context_storage.get(None) is not None
 
 
+def request_context_or_none() -> Optional[RequestContext]:
+    """当前请求上下文, 不在请求中时返回None, 只读取一次ContextVar"""
+    return _request_scope_context_storage.get(None)
+
+
 def request_context() -> RequestContext:
     value = _request_scope_context_storage.get(None)
     if value is None:
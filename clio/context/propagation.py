@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from .ctx import RequestContext
+from .errors import ContextDoesNotExistError
+from .globals import _request_scope_context_storage, request_context_or_none
+from .span import REMOTE_PARENT, REMOTE_TRACESTATE, current_span
+from .trace import trace_context
+from .trace_context import TraceContext, TraceFields
+
+T = TypeVar("T")
+
+# spawn_with_context创建的task, 保持引用直到结束, 避免task被垃圾回收
+_background_tasks: Set[asyncio.Task] = set()
+
+
+class ContextSnapshot(NamedTuple):
+    """
+    请求上下文中trace相关数据的不可变快照, 不引用Request, 可以pickle后传给进程池
+    trace_extra: trace字段, 包含x-trace-id
+    remote_parent: 捕获时的当前span(或上游span), 在其它线程/进程中创建的span以它为父span
+    """
+
+    trace_extra: TraceFields
+    remote_parent: Optional[Tuple[str, str, bool]] = None
+    tracestate: Optional[str] = None
+
+    def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """在一个新的contextvars.Context中恢复快照并执行func, 不影响调用线程的上下文"""
+        return self.context().run(func, *args, **kwargs)
+
+    def context(self) -> contextvars.Context:
+        """恢复了快照的contextvars.Context, 可以传给asyncio.create_task(context=...)"""
+        ctx = contextvars.Context()
+        ctx.run(self._install)
+        return ctx
+
+    def _install(self):
+        if self.trace_extra or self.remote_parent is not None:
+            _request_scope_context_storage.set(DetachedRequestContext(self))
+
+
+_EMPTY_SNAPSHOT = ContextSnapshot(TraceFields())
+
+
+class DetachedRequestContext(RequestContext):
+    """
+    脱离请求的上下文, 数据来自ContextSnapshot, trace_id/trace_extra与日志中的trace字段照常可用,
+    set只修改本上下文, 不会影响原请求, 没有Request对象
+    """
+
+    __slots__ = ()
+
+    def __init__(self, snapshot: ContextSnapshot):
+        super().__init__(None)
+        self.trace_extra = dict(snapshot.trace_extra)
+        self.trace_id = self.trace_extra.get(TraceContext.X_TRACE_ID, "")
+        self.trace_fields = snapshot.trace_extra
+        self._data[REMOTE_PARENT] = snapshot.remote_parent
+        self._data[REMOTE_TRACESTATE] = snapshot.tracestate
+
+    @property
+    def request(self):
+        raise ContextDoesNotExistError()
+
+
+def capture_context() -> ContextSnapshot:
+    """捕获当前请求的trace数据, 不在请求中时返回空快照"""
+    span = current_span()
+    ctx = request_context_or_none()
+    if ctx is None:
+        if span is None:
+            return _EMPTY_SNAPSHOT
+        return ContextSnapshot(
+            _EMPTY_SNAPSHOT.trace_extra,
+            (span.trace_id, span.span_id, span.sampled),
+            span.tracestate,
+        )
+    # trace_fields是每个请求缓存的只读快照, 直接复用
+    trace_extra = trace_context.trace_fields()
+    if span is not None:
+        return ContextSnapshot(
+            trace_extra, (span.trace_id, span.span_id, span.sampled), span.tracestate
+        )
+    return ContextSnapshot(
+        trace_extra, ctx.get(REMOTE_PARENT), ctx.get(REMOTE_TRACESTATE)
+    )
+
+
+async def run_in_threadpool_with_context(
+    func: Callable[..., T],
+    *args: Any,
+    executor: Optional[Executor] = None,
+    **kwargs: Any,
+) -> T:
+    """
+    在线程池中执行func, 只传递trace数据, 日志中照常带有x-trace-id
+    与asyncio.to_thread不同, 不会把整个请求上下文(包括Request)带到线程中
+    """
+    snapshot = capture_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(snapshot.run, func, *args, **kwargs)
+    )
+
+
+def spawn_with_context(
+    coro: Coroutine[Any, Any, T], name: Optional[str] = None
+) -> "asyncio.Task[T]":
+    """
+    创建后台task, task中只有trace数据, 请求结束后不会继续持有Request与请求体
+    task会被保持引用直到结束
+    """
+    task = asyncio.get_running_loop().create_task(
+        coro, name=name, context=capture_context().context()
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _call_with_snapshot(snapshot: ContextSnapshot, func, args, kwargs):
+    # 模块级函数, 可以被pickle传给进程池
+    return snapshot.run(func, *args, **kwargs)
+
+
+class ContextExecutor(Executor):
+    """
+    包装线程池或进程池, submit时捕获trace数据, 在worker中恢复
+    使用进程池时func与参数需要可以pickle, 子进程中的span需要自己配置Tracer才会导出
+
+    executor = ContextExecutor(ProcessPoolExecutor(4))
+    await asyncio.get_running_loop().run_in_executor(executor, cpu_task, data)
+    """
+
+    def __init__(self, executor: Optional[Executor] = None):
+        self.executor = executor or ThreadPoolExecutor(
+            thread_name_prefix="clio-context"
+        )
+
+    def submit(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> Future:
+        return self.executor.submit(
+            _call_with_snapshot, capture_context(), fn, args, kwargs
+        )
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
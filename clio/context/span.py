@@ -0,0 +1,246 @@
+import functools
+import inspect
+import os
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .globals import request_context_or_none
+
+TRACEPARENT = "traceparent"
+TRACESTATE = "tracestate"
+# RawContextMiddleware从请求头中解析出的上游trace, (trace_id, parent_span_id, sampled)
+REMOTE_PARENT = "__remote_parent"
+REMOTE_TRACESTATE = "__remote_tracestate"
+
+_HEX = frozenset("0123456789abcdef")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar(
+    "clio_current_span", default=None
+)
+_span_processor: Optional[Callable[["Span"], None]] = None
+
+
+def set_span_processor(processor: Optional[Callable[["Span"], None]]):
+    """span结束时调用processor, 由Tracer.configure设置"""
+    global _span_processor
+    _span_processor = processor
+
+
+def tracing_enabled() -> bool:
+    """是否配置了span的导出, 未配置时中间件与http_invoke不创建span, 只透传上游的traceparent"""
+    return _span_processor is not None
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def _is_hex(value: str, length: int) -> bool:
+    return len(value) == length and _HEX.issuperset(value) and value.strip("0") != ""
+
+
+def parse_traceparent(value: str) -> Optional[Tuple[str, str, bool]]:
+    """解析W3C traceparent: 00-<trace_id>-<parent_id>-<flags>, 格式错误时返回None"""
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    if len(version) != 2 or version == "ff" or not _HEX.issuperset(version):
+        return None
+    if version == "00" and len(parts) != 4:
+        return None
+    if not _is_hex(trace_id, 32) or not _is_hex(span_id, 16):
+        return None
+    if len(flags) != 2 or not _HEX.issuperset(flags):
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 0x01)
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool = True) -> str:
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+class Span:
+    """一段被计时的代码, start_time是unix时间戳(纳秒), duration单位纳秒"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "sampled",
+        "tracestate",
+        "attributes",
+        "start_time",
+        "duration",
+        "status",
+        "error",
+        "_start_perf",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        sampled: bool = True,
+        tracestate: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.tracestate = tracestate
+        self.attributes = attributes or {}
+        self.start_time = time.time_ns()
+        self._start_perf = time.perf_counter_ns()
+        self.duration: Optional[int] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace_id, self.span_id, self.sampled)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter_ns() - self._start_perf
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+        if self.sampled and _span_processor is not None:
+            _span_processor(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": (self.duration / 1e6 if self.duration is not None else None),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _remote_parent() -> Tuple[Optional[Tuple[str, str, bool]], Optional[str]]:
+    ctx = request_context_or_none()
+    if ctx is None:
+        return None, None
+    return ctx.get(REMOTE_PARENT), ctx.get(REMOTE_TRACESTATE)
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None) -> Span:
+    """
+    创建span, 父span依次取: 当前span, 请求头traceparent中的上游span, 都没有时开始新的trace
+    只创建不设为当前span, 需要自己调用end
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        return Span(
+            name,
+            parent.trace_id,
+            parent.span_id,
+            parent.sampled,
+            parent.tracestate,
+            attributes,
+        )
+    remote, tracestate = _remote_parent()
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+        return Span(name, trace_id, parent_id, sampled, tracestate, attributes)
+    return Span(name, new_trace_id(), attributes=attributes)
+
+
+class _SpanScope:
+    __slots__ = ("name", "attributes", "span", "_token")
+
+    def __init__(self, name: Optional[str], attributes: Dict[str, Any]):
+        # name为None时, 作为装饰器使用函数名, 作为上下文管理器使用"span"
+        self.name = name
+        self.attributes = attributes
+        self.span: Optional[Span] = None
+        self._token: Optional[Token] = None
+
+    def __enter__(self) -> Span:
+        self.span = start_span(self.name or "span", dict(self.attributes))
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.span.end(exc)
+        return False
+
+    async def __aenter__(self) -> Span:
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def __call__(self, func):
+        name = self.name or f"{func.__module__}.{func.__qualname__}"
+        attributes = self.attributes
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _SpanScope(name, attributes):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _SpanScope(name, attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def span(name: Optional[str] = None, **attributes: Any):
+    """
+    记录一段代码的耗时, 可以用作上下文管理器或装饰器, 作为装饰器时name默认为函数名
+
+    with span("load_user", user_id=1) as s:
+        s.set_attribute("cache", "miss")
+
+    @span("query_orders")
+    async def query_orders(): ...
+    """
+    if callable(name):
+        return _SpanScope(None, {})(name)
+    return _SpanScope(name, attributes)
+
+
+def inject_trace_headers(headers: Dict[str, str], parent: Optional[Span] = None):
+    """向调用下游的请求头中加入traceparent/tracestate, 没有当前span时透传上游的trace"""
+    parent = parent or _current_span.get()
+    if parent is not None:
+        headers[TRACEPARENT] = parent.traceparent
+        if parent.tracestate:
+            headers[TRACESTATE] = parent.tracestate
+        return
+    remote, tracestate = _remote_parent()
+    if remote is not None:
+        headers[TRACEPARENT] = format_traceparent(*remote)
+        if tracestate:
+            headers[TRACESTATE] = tracestate
@@ -0,0 +1,185 @@
+import abc
+import atexit
+import json
+import os
+import sys
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from clio.workspace import Workspace
+
+from .span import Span, set_span_processor
+
+
+class SpanExporter(abc.ABC):
+    """span导出器, export在后台线程中调用, 每次传入一批已结束的span"""
+
+    @abc.abstractmethod
+    def export(self, spans: List[Dict[str, Any]]):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+def _default_spans_path() -> str:
+    """默认写入默认workspace的logs目录, 没有初始化workspace时写入当前目录下的logs"""
+    try:
+        log_dir = str(Workspace.default().get_path("logs"))
+    except ValueError:
+        log_dir = "logs"
+    return os.path.abspath(os.path.join(log_dir, "spans.jsonl"))
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """每个span一行json, 写入本地文件, 路径在创建时转换为绝对路径, 之后切换工作目录不受影响"""
+
+    def __init__(self, path: Optional[str] = None):
+        path = os.path.abspath(path) if path else _default_spans_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = None
+
+    def export(self, spans: List[Dict[str, Any]]):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(
+            "".join(
+                json.dumps(s, ensure_ascii=False, default=str, separators=(",", ":"))
+                + "\n"
+                for s in spans
+            )
+        )
+        self._file.flush()
+
+    def shutdown(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BatchSpanProcessor:
+    """
+    结束的span先放入有界队列, 由后台线程攒批后交给exporter, 队列满时丢弃新的span
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue: int = 10000,
+        batch_size: int = 512,
+        flush_interval: float = 2.0,
+    ):
+        self.exporter = exporter
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: Deque[Span] = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._exporting = 0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="clio-span-export", daemon=True
+        )
+        self._thread.start()
+
+    def on_end(self, span: Span):
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._queue.append(span)
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._queue) < self.batch_size and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                if not self._queue:
+                    if self._closed:
+                        return
+                    continue
+                size = min(self.batch_size, len(self._queue))
+                batch = [self._queue.popleft() for _ in range(size)]
+                self._exporting += 1
+            try:
+                self.exporter.export([s.to_dict() for s in batch])
+            except Exception as e:
+                sys.stderr.write(f"export {len(batch)} spans error: {e}\n")
+            finally:
+                with self._cond:
+                    self._exporting -= 1
+                    self._cond.notify_all()
+
+    def force_flush(self, timeout: float = 5.0):
+        """等待队列中的span导出完成"""
+        with self._cond:
+            self._cond.notify_all()
+            self._cond.wait_for(
+                lambda: (not self._queue and not self._exporting)
+                or not self._thread.is_alive(),
+                timeout,
+            )
+
+    def shutdown(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5.0)
+        self.exporter.shutdown()
+
+
+class Tracer:
+    """
+    配置span的导出, 未配置时中间件与http_invoke不创建span, 只透传上游的traceparent
+
+    Tracer.configure()  # 默认写入workspace的 logs/spans.jsonl
+    Tracer.configure(MyExporter())
+    """
+
+    _processor: Optional[BatchSpanProcessor] = None
+
+    @staticmethod
+    def configure(
+        exporter: Optional[SpanExporter] = None,
+        max_queue: int = 10000,
+        batch_size: int = 512,
+        flush_interval: float = 2.0,
+    ) -> BatchSpanProcessor:
+        Tracer.shutdown()
+        processor = BatchSpanProcessor(
+            exporter or JsonLinesSpanExporter(),
+            max_queue=max_queue,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+        )
+        Tracer._processor = processor
+        set_span_processor(processor.on_end)
+        return processor
+
+    @staticmethod
+    def force_flush(timeout: float = 5.0):
+        if Tracer._processor is not None:
+            Tracer._processor.force_flush(timeout)
+
+    @staticmethod
+    def shutdown():
+        processor = Tracer._processor
+        if processor is None:
+            return
+        set_span_processor(None)
+        Tracer._processor = None
+        processor.shutdown()
+
+
+atexit.register(Tracer.shutdown)
@@ -1,74 +1,129 @@
-import base64
-import random
-import struct
+import itertools
+import os
 import time
 from typing import Any, Dict
 
-from .globals import has_request_context, request_context
+from .ctx import TRACE_EXTRA_KEY, TRACE_FIELDS_KEY, X_TRACE_ID
+from .globals import request_context_or_none
+from .span import (
+    REMOTE_PARENT,
+    REMOTE_TRACESTATE,
+    inject_trace_headers,
+    parse_traceparent,
+)
+
+_X_TRACE_ID_BYTES = b"x-trace-id"
+_TRACEPARENT_BYTES = b"traceparent"
+_TRACESTATE_BYTES = b"tracestate"
+
+# 进程随机数与计数器, 生成的id在多个worker之间不重复
+_process_seed = 0
+_id_counter = itertools.count()
+
+
+def _reseed():
+    global _process_seed, _id_counter
+    _process_seed = int.from_bytes(os.urandom(4), "big")
+    _id_counter = itertools.count(int.from_bytes(os.urandom(3), "big"))
+
+
+_reseed()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed)
+
+
+class TraceFields(dict):
+    """
+    trace字段的只读快照, 同一请求内的日志共用一个快照,
+    cache用于保存基于这些字段的格式化结果, 如日志前缀
+    """
+
+    __slots__ = ("cache",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache: Dict[str, Any] = {}
+
+
+_EMPTY_TRACE_FIELDS = TraceFields()
 
 
 class TraceContext:
-    X_TRACE_ID = "x-trace-id"
-    TRACE_EXTRA = "__trace_extra"
+    X_TRACE_ID = X_TRACE_ID
+    TRACE_EXTRA = TRACE_EXTRA_KEY
+    TRACE_FIELDS = TRACE_FIELDS_KEY
 
     def __init__(self, app_name: str):
         self.app_name = app_name
 
     def parse_trace_id(self, scope, context) -> Dict[str, str]:
-        raw_headers = list(scope.get("headers", []))
-        headers = {}
-        for key, value in raw_headers:
-            headers[key.decode("latin-1")] = value.decode("latin-1")
-        trace_id = headers.get(TraceContext.X_TRACE_ID, "")
+        # ASGI中header名已经是小写的bytes, 直接比较, 不需要把所有header解码成dict
+        trace_id = ""
+        traceparent = tracestate = None
+        for key, value in scope.get("headers", ()):
+            if key == _X_TRACE_ID_BYTES:
+                trace_id = value.decode("latin-1")
+            elif key == _TRACEPARENT_BYTES:
+                traceparent = value
+            elif key == _TRACESTATE_BYTES:
+                tracestate = value
+        if traceparent is not None:
+            # W3C traceparent, 上游没有传x-trace-id时使用W3C的trace id
+            remote = parse_traceparent(traceparent.decode("latin-1"))
+            if remote is not None:
+                context.set(REMOTE_PARENT, remote)
+                if tracestate is not None:
+                    context.set(REMOTE_TRACESTATE, tracestate.decode("latin-1"))
+                if not trace_id:
+                    trace_id = remote[0]
         if not trace_id:
             unique_id = self.create_unique_id()
             trace_id = f"{self.app_name}-{unique_id}"
         m = {TraceContext.X_TRACE_ID: trace_id}
-        extra_m = context.get(TraceContext.TRACE_EXTRA, {})
-        extra_m.update(m)
-        context.set(TraceContext.TRACE_EXTRA, extra_m)
+        context.update_trace_extra(m)
         return m
 
     def trace_id(self):
-        extra_map = self.trace_extra()
-        return extra_map.get(TraceContext.X_TRACE_ID, "")
+        ctx = request_context_or_none()
+        return ctx.trace_id if ctx is not None else ""
 
     def trace_extra(self):
-        if has_request_context():
-            return request_context().get("__trace_extra", {})
-        return {}
+        ctx = request_context_or_none()
+        return ctx.trace_extra if ctx is not None else {}
 
     def trace_extra_update(self, data: Dict[str, Any]):
-        if has_request_context():
-            ctx = request_context()
-            trace_extra = ctx.get("__trace_extra", {})
-            trace_extra.update(data)
-            ctx.set("__trace_extra", trace_extra)
+        ctx = request_context_or_none()
+        if ctx is not None:
+            ctx.update_trace_extra(data)
+
+    def trace_fields(self) -> TraceFields:
+        """
+        当前请求trace字段的快照, 每个请求只生成一次, trace_extra_update后重新生成
+        日志使用快照, 不需要每条日志都复制一次trace_extra
+        """
+        ctx = request_context_or_none()
+        if ctx is None:
+            return _EMPTY_TRACE_FIELDS
+        fields = ctx.trace_fields
+        if fields is None:
+            fields = ctx.trace_fields = TraceFields(ctx.trace_extra)
+        return fields
 
     def patch_http_invoke(self, headers: Dict[str, str]):
         trace_id = self.trace_id()
         if trace_id:
             headers.update({TraceContext.X_TRACE_ID: trace_id})
+        inject_trace_headers(headers)
 
     def create_unique_id(
         self,
     ):
-        time_ns = time.time_ns()
-        return self.time_based_unique_id(time_ns, 0)
-
-    def time_based_unique_id(self, timestamp, scale):
-        timestamp_bigint = int(timestamp)
-        random_long = self.next_long()
-        scale_bigint = int(scale)
-        if scale_bigint > 0:
-            timestamp_bigint = timestamp_bigint * scale_bigint + (
-                random_long % scale_bigint
-            )
-        buf = bytearray(16)
-        struct.pack_into(">q", buf, 0, timestamp_bigint)
-        struct.pack_into(">q", buf, 8, random_long)
-        result = base64.b64encode(buf).decode("ascii")
-        return result.replace("+", "-").replace("/", "_").rstrip("=")
-
-    def next_long(self):
-        return random.randint(-9223372036854775808, 9223372036854775807)
+        """
+        微秒时间戳 + 进程随机数 + 进程内计数器, 共28位16进制字符,
+        按字符串排序即按生成时间排序, 不同worker的进程随机数不同, 不会重复
+        """
+        return (
+            f"{time.time_ns() // 1000:014x}"
+            f"{_process_seed:08x}"
+            f"{next(_id_counter) & 0xFFFFFF:06x}"
+        )
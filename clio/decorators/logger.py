@@ -1,46 +1,132 @@
 import functools
 import inspect
+import logging
+import reprlib
 import time
 
-from clio.logger import Log
-from clio.utils import short_json
+from clio.logger import default_logger
+from clio.logger.formatter import FIELDS_ATTR
+from clio.metrics import MetricsRegistry
 from clio.web import HttpResponse
 
 """
     用于打印函数的输入输出日志,包括函数名,参数,返回值,执行时间，还可用于性能分析 覆盖了@timing_decorator的功能
+    日志级别未开启时不格式化参数与返回值, 执行时间同时记录到函数耗时直方图
 """
 
+FUNCTION_DURATION_METRIC = "clio_function_duration_seconds"
 
-def _format_result(result):
+_function_duration = MetricsRegistry.histogram(
+    FUNCTION_DURATION_METRIC,
+    "@logger装饰的函数的执行时间",
+    label_names=("function",),
+)
+
+
+def _truncate(text: str, limit: int) -> str:
+    if limit and len(text) > limit:
+        return f"{text[:limit]}...({len(text)} chars)"
+    return text
+
+
+def _reprer(limit: int) -> reprlib.Repr:
+    # reprlib在生成字符串时就限制长度, 大对象不会先完整转换为字符串
+    r = reprlib.Repr()
+    r.maxlevel = 3
+    r.maxstring = limit
+    r.maxother = limit
+    r.maxlist = r.maxtuple = r.maxdict = r.maxset = r.maxfrozenset = 20
+    return r
+
+
+def _format_result(result, limit: int, reprer: reprlib.Repr):
     if isinstance(result, HttpResponse):
-        return short_json(result)
+        # data同样用reprlib边生成边截断, 大列表不会先完整序列化再截断
+        text = (
+            f"HttpResponse(code={result.code}, message={reprer.repr(result.message)}, "
+            f"data={reprer.repr(result.data)})"
+        )
+        return _truncate(text, limit)
     else:
-        return str(result)
+        return _truncate(reprer.repr(result), limit)
 
 
-def logger(func):
+def logger(
+    func=None,
+    *,
+    level: int = logging.INFO,
+    max_arg_length: int = 256,
+    max_result_length: int = 512,
+    histogram: bool = True,
+):
+    """
+    @logger 或 @logger(level=logging.DEBUG, max_result_length=1024)
+
+    level: 日志级别, 未开启时只记录执行时间
+    max_arg_length/max_result_length: 参数与返回值在日志中的最大长度, 为0时不限制
+    histogram: 是否把执行时间记录到 clio_function_duration_seconds 直方图
+    """
+    if func is None:
+        return functools.partial(
+            logger,
+            level=level,
+            max_arg_length=max_arg_length,
+            max_result_length=max_result_length,
+            histogram=histogram,
+        )
+
     module_name = inspect.getmodule(func).__name__
     function_name = func.__name__
-    is_async = inspect.isasyncgenfunction(func)
+    qualified_name = f"{module_name}.{function_name}"
+    code = getattr(func, "__code__", None)
+    pathname = code.co_filename if code else module_name
+    lineno = code.co_firstlineno if code else 0
+    duration = _function_duration.labels(qualified_name) if histogram else None
+    arg_reprer = _reprer(max_arg_length)
+    result_reprer = _reprer(max_result_length)
+    is_async = inspect.iscoroutinefunction(func)
+    kind = "async" if is_async else "sync"
+
+    def record(elapsed_ns, args, kwargs, result, error):
+        if duration is not None:
+            duration.observe(elapsed_ns / 1e9)
+        if not default_logger.isEnabledFor(level):
+            return
+        elapsed_ms = elapsed_ns / 1e6
+        params = _truncate(
+            f"{arg_reprer.repr(args)},{arg_reprer.repr(kwargs)}", max_arg_length
+        )
+        if error is None:
+            outcome = (
+                f"result:【{_format_result(result, max_result_length, result_reprer)}】"
+            )
+        else:
+            outcome = f"error:【{type(error).__name__}: {_truncate(str(error), max_result_length)}】"
+        # 日志位置记为被装饰的函数, 采样时不同函数互不影响
+        log_record = default_logger.makeRecord(
+            default_logger.name,
+            level,
+            pathname,
+            lineno,
+            f"{kind} invoke 【{qualified_name}】 elapsed_time:【{elapsed_ms:.3f}ms】 ,param:【{params}】 ,{outcome}",
+            None,
+            None,
+            func=function_name,
+            extra={FIELDS_ATTR: {"function": qualified_name, "elapsed_ms": elapsed_ms}},
+        )
+        default_logger.handle(log_record)
 
     if is_async:
 
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = await func(*args, **kwargs)
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            Log.info(
-                "async invoke 【{}.{}】 elapsed_time:【{}】 ,param:【{},{}】 ,result:【{}】".format(
-                    module_name,
-                    function_name,
-                    elapsed_time,
-                    str(args),
-                    str(kwargs),
-                    _format_result(result),
-                )
-            )
+            start_time = time.perf_counter_ns()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                record(time.perf_counter_ns() - start_time, args, kwargs, None, e)
+                raise
+            record(time.perf_counter_ns() - start_time, args, kwargs, result, None)
             return result
 
         return wrapper
@@ -49,20 +135,13 @@ def logger(func):
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            Log.info(
-                "sync invoke 【{}.{}】 elapsed_time:【{}】 ,param:【{},{}】 ,result:【{}】".format(
-                    module_name,
-                    function_name,
-                    elapsed_time,
-                    str(args),
-                    str(kwargs),
-                    _format_result(result),
-                )
-            )
+            start_time = time.perf_counter_ns()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                record(time.perf_counter_ns() - start_time, args, kwargs, None, e)
+                raise
+            record(time.perf_counter_ns() - start_time, args, kwargs, result, None)
             return result
 
         return wrapper
@@ -1,4 +1,13 @@
-from .log import Log, console_handler, default_logger, file_handler
+from .async_handler import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_DEBUG_FIRST,
+    OVERFLOW_DROP_OLDEST,
+    AsyncLogHandler,
+)
+from .formatter import JsonFormatter, TraceFormatter
+from .log import CustomFileHandler, Log, console_handler, default_logger, file_handler
+from .rotating import DailyRotatingFileHandler
+from .sampling import SamplingFilter, call_site_key
 
 __all__ = [
     # log
@@ -6,4 +15,18 @@ __all__ = [
     "Log",
     "console_handler",
     "file_handler",
+    "CustomFileHandler",
+    # formatter
+    "TraceFormatter",
+    "JsonFormatter",
+    # rotating
+    "DailyRotatingFileHandler",
+    # sampling
+    "SamplingFilter",
+    "call_site_key",
+    # async_handler
+    "AsyncLogHandler",
+    "OVERFLOW_BLOCK",
+    "OVERFLOW_DROP_OLDEST",
+    "OVERFLOW_DROP_DEBUG_FIRST",
 ]
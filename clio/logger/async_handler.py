@@ -0,0 +1,225 @@
+import copy
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+from .formatter import TRACE_ATTR, capture_trace
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_DEBUG_FIRST = "drop_debug_first"
+_OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_DEBUG_FIRST)
+
+
+class AsyncLogHandler(logging.Handler):
+    """
+    异步写日志, emit只把record放入有界队列, 由后台线程批量写入目标handler
+
+    handler: 实际输出的handler, 如CustomFileHandler, logging.StreamHandler
+    max_queue: 队列长度
+    overflow: 队列满时的策略
+        block 调用方等待队列有空位
+        drop_oldest 丢弃最早的日志
+        drop_debug_first 优先丢弃最早的DEBUG日志, 没有DEBUG日志时丢弃最早的日志
+    batch_size: 后台线程每次最多写入的日志条数, StreamHandler/FileHandler一批只flush一次
+    flush_interval: 队列为空时后台线程的最长等待时间, 秒
+    进程退出时logging.shutdown会调用close, 把队列中剩余的日志写完
+    """
+
+    def __init__(
+        self,
+        handler: logging.Handler,
+        max_queue: int = 10000,
+        overflow: str = OVERFLOW_BLOCK,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+    ):
+        if overflow not in _OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow}")
+        if max_queue <= 0 or batch_size <= 0:
+            raise ValueError("max_queue and batch_size must be greater than 0")
+        super().__init__(handler.level)
+        self.handler = handler
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._queue: Deque[logging.LogRecord] = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._pending = 0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="clio-async-log", daemon=True
+        )
+        self._thread.start()
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        self.handler.setLevel(level)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        把依赖调用方状态的内容提前计算好:
+        trace信息, %参数格式化后的消息, 异常堆栈(traceback会引用栈帧, 不能跨线程保留)
+        与logging.handlers.QueueHandler一样修改的是record的副本, 同一个logger上的其它handler不受影响
+        """
+        record = copy.copy(record)
+        capture_trace(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            formatter = self.handler.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # 队列自身有锁, 不需要Handler的锁串行化调用方
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._queue) >= self.max_queue:
+                if self.overflow == OVERFLOW_BLOCK:
+                    while len(self._queue) >= self.max_queue and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                elif not self._drop_one(record):
+                    self.dropped += 1
+                    return
+            self._queue.append(record)
+            self._pending += 1
+            self._cond.notify_all()
+
+    def _drop_one(self, incoming: logging.LogRecord) -> bool:
+        """队列满时丢弃一条日志, 返回False表示丢弃incoming"""
+        if self.overflow == OVERFLOW_DROP_DEBUG_FIRST:
+            for i, queued in enumerate(self._queue):
+                if queued.levelno <= logging.DEBUG:
+                    del self._queue[i]
+                    self._pending -= 1
+                    self.dropped += 1
+                    return True
+            if incoming.levelno <= logging.DEBUG:
+                return False
+        self._queue.popleft()
+        self._pending -= 1
+        self.dropped += 1
+        return True
+
+    def _take_batch(self) -> Optional[List[logging.LogRecord]]:
+        with self._cond:
+            if not self._queue and not self._closed:
+                self._cond.wait(self.flush_interval)
+            if not self._queue:
+                return None if self._closed else []
+            size = min(self.batch_size, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(size)]
+            # 唤醒block策略下等待的调用方
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            dropped_report = self._dropped_report()
+            if dropped_report is not None:
+                batch.append(dropped_report)
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._pending -= len(batch) - (1 if dropped_report is not None else 0)
+                self._cond.notify_all()
+
+    def _dropped_report(self) -> Optional[logging.LogRecord]:
+        dropped = self.dropped
+        if dropped == self._reported_dropped:
+            return None
+        count = dropped - self._reported_dropped
+        self._reported_dropped = dropped
+        record = logging.LogRecord(
+            "clio",
+            logging.WARNING,
+            __file__,
+            0,
+            f"日志队列已满, 丢弃了 {count} 条日志",
+            None,
+            None,
+        )
+        setattr(record, TRACE_ATTR, {})
+        return record
+
+    def _write(self, batch: List[logging.LogRecord]):
+        handler = self.handler
+        if not isinstance(handler, logging.StreamHandler):
+            for record in batch:
+                handler.handle(record)
+            return
+        lines = []
+        for record in batch:
+            if record.levelno < handler.level or not handler.filter(record):
+                continue
+            try:
+                lines.append(handler.format(record) + handler.terminator)
+            except Exception:
+                handler.handleError(record)
+        if not lines:
+            return
+        write_batch = getattr(handler, "write_batch", None)
+        if write_batch is not None:
+            try:
+                write_batch("".join(lines))
+            except Exception:
+                handler.handleError(batch[-1])
+            return
+        handler.acquire()
+        try:
+            if handler.stream is None and isinstance(handler, logging.FileHandler):
+                handler.stream = handler._open()
+            handler.stream.write("".join(lines))
+            handler.flush()
+        except Exception:
+            handler.handleError(batch[-1])
+        finally:
+            handler.release()
+
+    def flush(self, timeout: Optional[float] = 5.0):
+        """等待队列中已有的日志写入完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending > 0 and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        self.handler.flush()
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5.0)
+        try:
+            self.handler.close()
+        finally:
+            super().close()
@@ -0,0 +1,136 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from clio.context import TraceContext
+from clio.context.trace import trace_context
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# 入队时保存的trace快照
+TRACE_ATTR = "clio_trace"
+# Log.*(msg, **fields)传入的字段
+FIELDS_ATTR = "clio_fields"
+
+
+def capture_trace(record: logging.LogRecord):
+    """在调用方的上下文中保存trace快照, 写日志的线程里已经没有请求上下文"""
+    if not hasattr(record, TRACE_ATTR):
+        setattr(record, TRACE_ATTR, trace_context.trace_fields())
+
+
+def record_trace(record: logging.LogRecord) -> Dict[str, Any]:
+    fields = getattr(record, TRACE_ATTR, None)
+    if fields is None:
+        fields = trace_context.trace_fields()
+    return fields
+
+
+def trace_prefix(record: logging.LogRecord) -> str:
+    """日志前缀: trace id 和其它trace字段, 每个trace快照只生成一次"""
+    extra_map = record_trace(record)
+    if not extra_map:
+        return ""
+    cache = getattr(extra_map, "cache", None)
+    if cache is not None and "prefix" in cache:
+        return cache["prefix"]
+    parts = []
+    trace_id = extra_map.get(TraceContext.X_TRACE_ID)
+    if trace_id:
+        parts.append(f"{trace_id} ｜")
+    others = [
+        f"{str(k)}={str(v)}"
+        for k, v in extra_map.items()
+        if k != TraceContext.X_TRACE_ID
+    ]
+    if others:
+        parts.append("[")
+        parts.extend(others)
+        parts.append("]")
+    prefix = " ".join(parts)
+    if cache is not None:
+        cache["prefix"] = prefix
+    return prefix
+
+
+class TraceFormatter(logging.Formatter):
+    """在消息前加上trace信息, 消息后加上Log.*传入的字段, 不修改record.msg/args"""
+
+    def formatMessage(self, record):
+        prefix = trace_prefix(record)
+        fields = getattr(record, FIELDS_ATTR, None)
+        if prefix or fields:
+            # record.message 是每次format时由getMessage重新生成的
+            message = record.message
+            if prefix:
+                message = f"{prefix} {message}"
+            if fields:
+                message += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+            record.message = message
+        return super().formatMessage(record)
+
+
+def _dumps(data: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志输出一行json, 日志采集不需要再用正则解析
+    {"x-trace-id": ..., "time": ..., "level": ..., "logger": ..., "message": ..., 其它字段}
+    trace字段每个trace快照只序列化一次, 安装了orjson时使用orjson序列化
+    """
+
+    def __init__(self, static_fields: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.static_fields = dict(static_fields or {})
+
+    def formatTime(self, record, datefmt=None):
+        return (
+            datetime.fromtimestamp(record.created)
+            .astimezone()
+            .isoformat(timespec="milliseconds")
+        )
+
+    def _trace_json(self, record: logging.LogRecord) -> str:
+        extra_map = record_trace(record)
+        if not extra_map:
+            return ""
+        cache = getattr(extra_map, "cache", None)
+        if cache is not None and "json" in cache:
+            return cache["json"]
+        encoded = _dumps(dict(extra_map))
+        if cache is not None:
+            cache["json"] = encoded
+        return encoded
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, FIELDS_ATTR, None)
+        for extra in (fields, self.static_fields):
+            if extra:
+                for k, v in extra.items():
+                    data.setdefault(k, v)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+        encoded = _dumps(data)
+        trace_json = self._trace_json(record)
+        if len(trace_json) > 2:
+            # 拼接预先序列化好的trace字段: {trace...} + {data...}
+            encoded = f"{trace_json[:-1]},{encoded[1:]}"
+        return encoded
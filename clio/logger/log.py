@@ -1,12 +1,10 @@
-import glob
 import logging
-import os
-from datetime import datetime
 
 import colorlog
 
-from clio.context import TraceContext
-from clio.context.trace import trace_context
+from .async_handler import AsyncLogHandler
+from .formatter import FIELDS_ATTR, JsonFormatter, TraceFormatter
+from .rotating import DailyRotatingFileHandler
 
 logging.basicConfig(level=logging.DEBUG)
 default_logger = logging.getLogger("clio")
@@ -14,23 +12,28 @@ default_logger.propagate = False
 
 
 class CustomFileHandler(logging.FileHandler):
-    def emit(self, record):
-        extra_map = trace_context.trace_extra()
-        trace_id = extra_map.pop(TraceContext.X_TRACE_ID, None)
-        lines = []
-        if trace_id:
-            lines.append(f"{trace_id} ｜")
-        if extra_map:
-            lines.append("[")
-            for k, v in extra_map.items():
-                lines.append(f"{str(k)}={str(v)}")
-            lines.append("]")
-        lines.append(record.msg)
-        record.msg = " ".join(lines)
-        super().emit(record)
-
-
-def console_handler(log_level=logging.DEBUG):
+    def __init__(self, filename, mode="a", encoding="utf-8", delay=False):
+        super().__init__(filename, mode=mode, encoding=encoding, delay=delay)
+        self.setFormatter(TraceFormatter())
+
+
+def _async_wrap(handler: logging.Handler, async_mode: bool, async_options):
+    if not async_mode:
+        return handler
+    return AsyncLogHandler(handler, **(async_options or {}))
+
+
+def console_handler(
+    log_level=logging.DEBUG,
+    async_mode=False,
+    async_options=None,
+    json_format=False,
+):
+    """
+    json_format: 每条日志输出一行json, 用于容器内由日志采集器读取标准输出
+    async_mode: 开启后日志由后台线程输出, 不阻塞事件循环
+    async_options: 传给AsyncLogHandler的参数, 如max_queue, overflow, batch_size
+    """
     _formatter = colorlog.ColoredFormatter(
         "%(log_color)s%(asctime)s - %(levelname)5s - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
@@ -43,9 +46,9 @@ def console_handler(log_level=logging.DEBUG):
         },
     )
     _handler = logging.StreamHandler()
-    _handler.setFormatter(_formatter)
+    _handler.setFormatter(JsonFormatter() if json_format else _formatter)
     _handler.setLevel(log_level)
-    return _handler
+    return _async_wrap(_handler, async_mode, async_options)
 
 
 def file_handler(
@@ -53,49 +56,74 @@ def file_handler(
     file_max_keep_days=7,
     logging_level=logging.INFO,
     log_format="%(asctime)s | %(levelname)s | %(message)s",
+    async_mode=False,
+    async_options=None,
+    json_format=False,
+    max_bytes=None,
+    compress=True,
+    per_worker=False,
 ):
-    current_date = datetime.now()
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    for log_file in glob.glob(os.path.join(log_dir, "*.log")):
-        file_date_str = os.path.basename(log_file).split(".")[0]
-        file_date = datetime.strptime(file_date_str, "%Y_%m_%d")
-        days_difference = (current_date - file_date).days
-        if days_difference > file_max_keep_days:
-            try:
-                os.remove(log_file)
-            except Exception as e:
-                pass
-
-    time = datetime.now().strftime("%Y_%m_%d")
-    log_file_handler = CustomFileHandler(f"{log_dir}/{time}.log")
+    """
+    日志文件按日期滚动, 超过max_bytes时按大小滚动, 滚动出去的文件在后台压缩,
+    超过file_max_keep_days的文件在后台定期删除
+    json_format: 每条日志输出一行json, 包含trace字段与Log.*传入的字段
+    async_mode: 开启后日志由后台线程批量写入文件, 不阻塞事件循环
+    async_options: 传给AsyncLogHandler的参数, 如max_queue, overflow, batch_size
+    per_worker: 默认所有进程通过文件锁轮流写同一个文件, 建议同时开启async_mode, 批量写入减少加锁次数,
+        为True时每个进程写自己的文件 <date>.<pid>.log
+    """
+    log_file_handler = DailyRotatingFileHandler(
+        log_dir,
+        max_bytes=max_bytes,
+        keep_days=file_max_keep_days,
+        compress=compress,
+        per_worker=per_worker,
+    )
     log_file_handler.setLevel(logging_level)
-    log_file_handler.setFormatter(logging.Formatter(log_format))
-    return log_file_handler
+    log_file_handler.setFormatter(
+        JsonFormatter() if json_format else TraceFormatter(log_format)
+    )
+    return _async_wrap(log_file_handler, async_mode, async_options)
+
+
+_LOGGING_KWARGS = ("exc_info", "extra", "stack_info", "stacklevel")
+
+
+def _with_fields(kwargs):
+    """logging本身参数以外的关键字参数作为结构化字段, Log.info("msg", user_id=1)"""
+    if kwargs:
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _LOGGING_KWARGS}
+        if fields:
+            extra = dict(kwargs.get("extra") or {})
+            extra[FIELDS_ATTR] = fields
+            kwargs["extra"] = extra
+    # 日志的pathname/lineno/funcName记录调用Log.*的位置, 采样按调用位置区分日志
+    kwargs.setdefault("stacklevel", 2)
+    return kwargs
 
 
 class Log:
     @staticmethod
     def debug(msg, *args, **kwargs):
-        default_logger.debug(msg, *args, **kwargs)
+        default_logger.debug(msg, *args, **_with_fields(kwargs))
 
     @staticmethod
     def info(msg, *args, **kwargs):
-        default_logger.info(msg, *args, **kwargs)
+        default_logger.info(msg, *args, **_with_fields(kwargs))
 
     @staticmethod
     def warn(msg, *args, **kwargs):
-        default_logger.warning(msg, *args, **kwargs)
+        default_logger.warning(msg, *args, **_with_fields(kwargs))
 
     @staticmethod
     def error(msg, *args, **kwargs):
         exec_info = kwargs.pop("exc_info", True)
-        default_logger.error(msg, *args, exc_info=exec_info, **kwargs)
+        default_logger.error(msg, *args, exc_info=exec_info, **_with_fields(kwargs))
 
     @staticmethod
     def fatal(msg, *args, **kwargs):
-        default_logger.critical(msg, *args, exc_info=True, **kwargs)
+        default_logger.critical(msg, *args, exc_info=True, **_with_fields(kwargs))
 
     @staticmethod
     def exception(msg="", *args, **kwargs):
-        default_logger.exception(msg, *args, exc_info=True, **kwargs)
+        default_logger.exception(msg, *args, exc_info=True, **_with_fields(kwargs))
@@ -0,0 +1,282 @@
+import gzip
+import logging
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from .formatter import TraceFormatter
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+DATE_FORMAT = "%Y_%m_%d"
+_LOCK_FILE_NAME = ".clio-log.lock"
+# 检查日期与其它进程是否滚动了文件的间隔, 秒, 不在每次写入时检查
+_CHECK_INTERVAL = 1.0
+
+
+def _compress_file(path: str):
+    """gzip压缩并删除原文件, 先写临时文件, 多个进程同时压缩时也不会产生损坏的文件"""
+    target = f"{path}.gz"
+    if not os.path.exists(path) or os.path.exists(target):
+        return
+    temp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(path, "rb") as src, gzip.open(temp, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(temp, target)
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        sys.stderr.write(f"compress log file {path} error: {e}\n")
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+class DailyRotatingFileHandler(logging.FileHandler):
+    """
+    按日期和大小滚动的日志文件, 文件名为 2024_01_01.log, 超过max_bytes时当前文件重命名为 2024_01_01.1.log
+    滚动出去的文件与之前日期的文件在后台线程中gzip压缩, 超过keep_days的文件在后台定期删除
+
+    max_bytes: 单个文件的最大字节数, 为None时只按日期滚动
+    keep_days: 日志保留天数
+    compress: 是否压缩滚动出去的文件
+    per_worker: 默认为False, 所有进程写同一个文件, 每次写入与滚动都持有文件锁(fcntl.flock), 进程之间会互相等待,
+        这时建议同时开启async_mode, 由后台线程批量写入, 每批只加一次锁,
+        为True时每个进程写自己的文件 2024_01_01.<pid>.log, 多进程部署(uvicorn --workers N)时互不竞争,
+        其它仍在运行的进程正在写的文件不会被压缩
+    日期与文件大小不在每次写入时检查: 大小按写入的字节数累计, 日期与其它进程的滚动每秒检查一次
+    sweep_interval: 清理过期文件与压缩旧文件的间隔, 秒
+    """
+
+    def __init__(
+        self,
+        log_dir: str,
+        max_bytes: Optional[int] = None,
+        keep_days: int = 7,
+        compress: bool = True,
+        per_worker: bool = False,
+        sweep_interval: float = 3600,
+        encoding: str = "utf-8",
+    ):
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.keep_days = keep_days
+        self.compress = compress
+        self.per_worker = per_worker
+        self.sweep_interval = sweep_interval
+        self._date = datetime.now().strftime(DATE_FORMAT)
+        self._pid = os.getpid()
+        self._lock_fd: Optional[int] = None
+        self._next_sweep = 0.0
+        self._next_check = 0.0
+        self._bytes = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid = 0
+        super().__init__(self._path_for(self._date), encoding=encoding, delay=True)
+        self.setFormatter(TraceFormatter())
+
+    def _path_for(self, date: str) -> str:
+        if self.per_worker:
+            return os.path.join(self.log_dir, f"{date}.{os.getpid()}.log")
+        return os.path.join(self.log_dir, f"{date}.log")
+
+    @contextmanager
+    def _process_lock(self) -> Iterator[None]:
+        if self.per_worker or fcntl is None:
+            yield
+            return
+        if self._lock_fd is None or self._pid != os.getpid():
+            self._lock_fd = os.open(
+                os.path.join(self.log_dir, _LOCK_FILE_NAME),
+                os.O_CREAT | os.O_RDWR,
+                0o644,
+            )
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _reopen(self, path: str):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = path
+        self.stream = self._open()
+        self._bytes = os.fstat(self.stream.fileno()).st_size
+
+    def _is_current(self, path: str) -> bool:
+        """打开的文件是否仍然是path, 其它进程滚动后path会指向新文件"""
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return current.st_ino == os.fstat(self.stream.fileno()).st_ino
+
+    def _ensure_stream(self):
+        """
+        在写入前检查进程, 每隔_CHECK_INTERVAL检查一次日期以及其它进程是否已经滚动了文件
+        共享文件时同时用文件的实际大小校正累计的字节数
+        """
+        now = time.monotonic()
+        if (
+            self.stream is not None
+            and self._pid == os.getpid()
+            and now < self._next_check
+        ):
+            return
+        self._next_check = now + _CHECK_INTERVAL
+        date = datetime.now().strftime(DATE_FORMAT)
+        if date != self._date:
+            self._date = date
+            # 日期变化后尽快压缩前一天的文件
+            self._next_sweep = 0.0
+        path = self._path_for(date)
+        if self.stream is None or path != self.baseFilename or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._reopen(path)
+        elif not self.per_worker:
+            if self._is_current(path):
+                self._bytes = os.fstat(self.stream.fileno()).st_size
+            else:
+                self._reopen(path)
+
+    def _submit(self, fn, *args):
+        """压缩与清理在后台线程中执行, fork出的子进程中重新创建线程池"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="clio-log-rotate"
+            )
+            self._executor_pid = os.getpid()
+        try:
+            self._executor.submit(fn, *args)
+        except RuntimeError:
+            # 解释器退出时线程池已经关闭, 直接在当前线程执行
+            fn(*args)
+
+    def _rotate(self, path: str):
+        if not self.per_worker and not self._is_current(path):
+            # 其它进程已经滚动了文件, 打开新文件继续写
+            self._reopen(path)
+            return
+        self.stream.close()
+        self.stream = None
+        stem = path[: -len(".log")]
+        index = 1
+        while os.path.exists(f"{stem}.{index}.log") or os.path.exists(
+            f"{stem}.{index}.log.gz"
+        ):
+            index += 1
+        rotated = f"{stem}.{index}.log"
+        os.rename(path, rotated)
+        self._reopen(path)
+        if self.compress:
+            self._submit(_compress_file, rotated)
+
+    def _sweep(self, today: str, current: str):
+        """删除过期文件, 压缩之前日期的文件"""
+        now = datetime.now()
+        try:
+            names = os.listdir(self.log_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not (name.endswith(".log") or name.endswith(".log.gz")):
+                continue
+            date_str = name.split(".")[0]
+            try:
+                file_date = datetime.strptime(date_str, DATE_FORMAT)
+            except ValueError:
+                continue
+            path = os.path.join(self.log_dir, name)
+            if (now - file_date).days > self.keep_days:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    sys.stderr.write(f"remove log file {path} error: {e}\n")
+            elif (
+                self.compress
+                and name.endswith(".log")
+                and date_str < today
+                and path != current
+                and not self._written_by_other_worker(name)
+            ):
+                _compress_file(path)
+
+    def _written_by_other_worker(self, name: str) -> bool:
+        """
+        per_worker时 2024_01_01.<pid>.log 是该进程正在写的文件, 进程还在运行时不压缩,
+        日期变化后它最多还会写_CHECK_INTERVAL, 由它自己的清理压缩
+        """
+        if not self.per_worker:
+            return False
+        parts = name.split(".")
+        if len(parts) != 3 or not parts[1].isdigit():
+            return False
+        pid = int(parts[1])
+        if pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # 进程存在, 属于其它用户
+            pass
+        return True
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        self._submit(self._sweep, self._date, self.baseFilename)
+
+    def write_batch(self, text: str):
+        """写入一批已经格式化好的日志, AsyncLogHandler批量写入时调用"""
+        self.acquire()
+        try:
+            with self._process_lock():
+                self._ensure_stream()
+                self.stream.write(text)
+                self.stream.flush()
+                if self.max_bytes:
+                    self._bytes += (
+                        len(text) if text.isascii() else len(text.encode(self.encoding))
+                    )
+                    if self._bytes >= self.max_bytes:
+                        self._rotate(self.baseFilename)
+            self._maybe_sweep()
+        finally:
+            self.release()
+
+    def emit(self, record):
+        try:
+            self.write_batch(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            super().close()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+        finally:
+            self.release()
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True)
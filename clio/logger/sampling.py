@@ -0,0 +1,179 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# 采样汇总日志的标记, 不参与采样
+SAMPLING_REPORT_ATTR = "clio_sampling_report"
+
+
+def call_site_key(record: logging.LogRecord) -> Hashable:
+    """按打印日志的代码位置区分, f-string拼出来的消息每次都不同, 不能用消息本身做key"""
+    return record.pathname, record.lineno
+
+
+class _SampleState:
+    __slots__ = ("seen", "tokens", "last_refill", "suppressed")
+
+    def __init__(self, tokens: float, now: float):
+        self.seen = 0
+        self.tokens = tokens
+        self.last_refill = now
+        self.suppressed = 0
+
+
+class SamplingFilter(logging.Filter):
+    """
+    日志采样, 限制热点代码与错误风暴产生的日志量, 加到logger上时在格式化与写入之前就丢弃日志
+
+    每个key(默认是打印日志的代码位置)分别计数, 配置了多个策略时都通过才输出
+    every_n: 每N条输出1条
+    rate/burst: 令牌桶, 每秒最多输出rate条, 允许burst条突发
+    first_n/then_every: 先输出前first_n条, 之后每then_every条输出1条, then_every为None时之后全部丢弃
+    max_level: 只对不高于该级别的日志采样, 默认ERROR, CRITICAL日志总是输出
+    report_interval: 汇总被丢弃日志数量的间隔, 秒, 由后台线程定时汇总, 作为一条WARNING日志输出,
+        进程退出或调用close()时汇总最后一次, 也可以随时调用report()立即汇总
+    max_keys: 最多记录的key数量, 超出时淘汰最早的key
+
+    default_logger.addFilter(SamplingFilter(rate=10, burst=50))
+    """
+
+    def __init__(
+        self,
+        every_n: Optional[int] = None,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        first_n: Optional[int] = None,
+        then_every: Optional[int] = None,
+        max_level: int = logging.ERROR,
+        key_func: Callable[[logging.LogRecord], Hashable] = call_site_key,
+        report_interval: float = 60.0,
+        max_keys: int = 10000,
+    ):
+        super().__init__()
+        if every_n is not None and every_n <= 0:
+            raise ValueError("every_n must be greater than 0")
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        if then_every is not None and then_every <= 0:
+            raise ValueError("then_every must be greater than 0")
+        self.every_n = every_n
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate or 1))
+        self.first_n = first_n
+        self.then_every = then_every
+        self.max_level = max_level
+        self.key_func = key_func
+        self.report_interval = report_interval
+        self.max_keys = max_keys
+        self.suppressed_total = 0
+        self._states: Dict[Hashable, _SampleState] = {}
+        self._lock = threading.Lock()
+        self._logger_name = "clio"
+        self._reporter_pid = 0
+        self._closed = threading.Event()
+        atexit.register(self.close)
+
+    def _keep(self, state: _SampleState, now: float) -> bool:
+        seen = state.seen
+        if self.first_n is not None and seen > self.first_n:
+            if self.then_every is None or (seen - self.first_n) % self.then_every:
+                return False
+        if self.every_n is not None and (seen - 1) % self.every_n:
+            return False
+        if self.rate is not None:
+            state.tokens = min(
+                float(self.burst),
+                state.tokens + (now - state.last_refill) * self.rate,
+            )
+            state.last_refill = now
+            if state.tokens < 1:
+                return False
+            state.tokens -= 1
+        return True
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or hasattr(record, SAMPLING_REPORT_ATTR):
+            return True
+        key = self.key_func(record)
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                if len(self._states) >= self.max_keys:
+                    del self._states[next(iter(self._states))]
+                state = _SampleState(float(self.burst), now)
+                self._states[key] = state
+            state.seen += 1
+            keep = self._keep(state, now)
+            if not keep:
+                state.suppressed += 1
+                self.suppressed_total += 1
+                self._logger_name = record.name
+        if not keep:
+            self._ensure_reporter()
+        return keep
+
+    def _ensure_reporter(self):
+        """每个进程一个后台汇总线程, 第一次丢弃日志时启动, fork出的子进程中重新启动"""
+        if self._reporter_pid == os.getpid() or self._closed.is_set():
+            return
+        with self._lock:
+            if self._reporter_pid == os.getpid():
+                return
+            self._reporter_pid = os.getpid()
+            threading.Thread(
+                target=self._run, name="clio-log-sampling-report", daemon=True
+            ).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._reporter_pid == pid and not self._closed.wait(self.report_interval):
+            self.report()
+
+    def _collect_suppressed(self) -> Dict[Hashable, int]:
+        suppressed = {}
+        for key, state in self._states.items():
+            if state.suppressed:
+                suppressed[key] = state.suppressed
+                state.suppressed = 0
+        return suppressed
+
+    def _report(self, logger: logging.Logger, suppressed: Dict[Hashable, int]):
+        top: List[Any] = sorted(suppressed.items(), key=lambda kv: kv[1], reverse=True)
+        details = ", ".join(f"{_key_str(key)} x{count}" for key, count in top[:5])
+        record = logger.makeRecord(
+            logger.name,
+            logging.WARNING,
+            __file__,
+            0,
+            f"日志采样丢弃了 {sum(suppressed.values())} 条日志: {details}",
+            None,
+            None,
+            extra={SAMPLING_REPORT_ATTR: True},
+        )
+        logger.handle(record)
+
+    def report(self, logger: Optional[logging.Logger] = None):
+        """立即汇总输出被丢弃的日志数量, 默认输出到最近一条被丢弃日志所属的logger"""
+        with self._lock:
+            suppressed = self._collect_suppressed()
+            logger_name = self._logger_name
+        if suppressed:
+            self._report(logger or logging.getLogger(logger_name), suppressed)
+
+    def close(self):
+        """停止后台汇总线程并汇总最后一次, 从logger上移除时调用"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        atexit.unregister(self.close)
+        self.report()
+
+
+def _key_str(key: Hashable) -> str:
+    if isinstance(key, tuple) and len(key) == 2:
+        return f"{key[0]}:{key[1]}"
+    return str(key)
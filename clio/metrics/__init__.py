@@ -0,0 +1,34 @@
+from .exposition import PROMETHEUS_CONTENT_TYPE, render_prometheus
+from .metrics import (
+    DEFAULT_LATENCY_BUCKETS,
+    Counter,
+    CounterValue,
+    Gauge,
+    GaugeValue,
+    Histogram,
+    HistogramValue,
+    Metric,
+)
+from .multiprocess import METRICS_DIR_ENV, MultiProcessStore, merge_dumps
+from .registry import MetricsRegistry
+
+__all__ = [
+    # metrics
+    "DEFAULT_LATENCY_BUCKETS",
+    "Metric",
+    "Counter",
+    "CounterValue",
+    "Gauge",
+    "GaugeValue",
+    "Histogram",
+    "HistogramValue",
+    # registry
+    "MetricsRegistry",
+    # multiprocess
+    "METRICS_DIR_ENV",
+    "MultiProcessStore",
+    "merge_dumps",
+    # exposition
+    "PROMETHEUS_CONTENT_TYPE",
+    "render_prometheus",
+]
@@ -0,0 +1,60 @@
+import math
+from typing import Any, Dict, List, Sequence
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_prometheus(dump: Dict[str, Dict[str, Any]]) -> str:
+    """把MetricsRegistry.collect()的结果转为Prometheus文本格式"""
+    lines: List[str] = []
+    for name in sorted(dump):
+        family = dump[name]
+        metric_type = family["type"]
+        label_names = family["label_names"]
+        if family.get("description"):
+            lines.append(f"# HELP {name} {_escape_help(family['description'])}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for label_values, value in family["values"]:
+            if metric_type != "histogram":
+                lines.append(
+                    f"{name}{_labels(label_names, label_values)} {_format_value(value)}"
+                )
+                continue
+            cumulative = 0
+            bounds = list(family["buckets"]) + [math.inf]
+            for bound, count in zip(bounds, value["counts"]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{name}_bucket{_labels(label_names, label_values, le)} {cumulative}"
+                )
+            labels = _labels(label_names, label_values)
+            lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{labels} {value['count']}")
+    lines.append("")
+    return "\n".join(lines)
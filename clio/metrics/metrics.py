@@ -0,0 +1,278 @@
+import abc
+import bisect
+import math
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+class HistogramValue:
+    """一组label对应的直方图, 固定分桶计数, 分位数由分桶线性插值估算"""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        # 最后一个是+Inf桶
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q取值0~1, 没有数据时返回None"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count == 0:
+                continue
+            if cumulative + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                lower = min(lower, upper)
+                fraction = (rank - cumulative) / bucket_count
+                return lower + (upper - lower) * fraction
+            cumulative += bucket_count
+        return self.max
+
+    def dump(self) -> Dict[str, Any]:
+        return {
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class Metric(abc.ABC):
+    type = "untyped"
+
+    def __init__(
+        self, name: str, description: str = "", label_names: Sequence[str] = ()
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._children: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+
+    def _label_values(self, args: Sequence[str], kwargs: Dict[str, str]) -> LabelValues:
+        if kwargs:
+            args = tuple(kwargs.get(name, "") for name in self.label_names)
+        if len(args) != len(self.label_names):
+            raise ValueError(
+                f"metric {self.name} expects labels {self.label_names}, got {args}"
+            )
+        return tuple(str(value) for value in args)
+
+    @abc.abstractmethod
+    def _new_child(self):
+        pass
+
+    def labels(self, *args: str, **kwargs: str):
+        key = self._label_values(args, kwargs)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def children(self) -> Dict[LabelValues, object]:
+        return dict(self._children)
+
+    @abc.abstractmethod
+    def summary(self) -> Dict[str, Any]:
+        pass
+
+    def dump(self) -> Dict[str, Any]:
+        """可序列化的当前值, 用于多进程聚合与Prometheus输出"""
+        return {
+            "type": self.type,
+            "description": self.description,
+            "label_names": list(self.label_names),
+            "values": [
+                [list(key), child.dump()] for key, child in self.children().items()
+            ],
+        }
+
+
+class CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("counter can only increase")
+        with self._lock:
+            self.value += amount
+
+    def dump(self) -> float:
+        return self.value
+
+
+class Counter(Metric):
+    """
+    只增不减的计数器, 名称以_total结尾
+
+    c = MetricsRegistry.counter("clio_errors_total", label_names=("type", "code"))
+    c.labels("business", "1001").inc()
+    """
+
+    type = "counter"
+
+    def _new_child(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1.0, *label_values: str):
+        self.labels(*label_values).inc(amount)
+
+    def summary(self) -> Dict[str, float]:
+        return {",".join(key): child.value for key, child in self.children().items()}
+
+
+class GaugeValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def dump(self) -> float:
+        return self.value
+
+
+GAUGE_MODES = ("sum", "max", "min", "all")
+
+
+class Gauge(Metric):
+    """
+    可增可减的瞬时值
+    multiprocess_mode: 多进程聚合方式, sum/max/min 只统计存活的进程, all 每个进程一条, 带pid标签
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str = "",
+        label_names: Sequence[str] = (),
+        multiprocess_mode: str = "sum",
+    ):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"unknown gauge multiprocess mode {multiprocess_mode}")
+        super().__init__(name, description, label_names)
+        self.multiprocess_mode = multiprocess_mode
+
+    def _new_child(self) -> GaugeValue:
+        return GaugeValue()
+
+    def set(self, value: float, *label_values: str):
+        self.labels(*label_values).set(value)
+
+    def summary(self) -> Dict[str, float]:
+        return {",".join(key): child.value for key, child in self.children().items()}
+
+    def dump(self) -> Dict[str, Any]:
+        data = super().dump()
+        data["multiprocess_mode"] = self.multiprocess_mode
+        return data
+
+
+class Histogram(Metric):
+    """
+    固定分桶直方图, 单位由使用方约定, 延迟统一用秒
+
+    h = MetricsRegistry.histogram("clio_function_duration_seconds", label_names=("function",))
+    h.labels("app.service.query").observe(0.012)
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str = "",
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, description, label_names)
+        buckets = tuple(sorted(float(b) for b in buckets if not math.isinf(b)))
+        if not buckets:
+            raise ValueError("histogram must have at least one bucket")
+        self.buckets = buckets
+
+    def _new_child(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float, *label_values: str):
+        self.labels(*label_values).observe(value)
+
+    def summary(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {
+            ",".join(key): child.summary() for key, child in self.children().items()
+        }
+
+    def dump(self) -> Dict[str, Any]:
+        data = super().dump()
+        data["buckets"] = list(self.buckets)
+        return data
@@ -0,0 +1,164 @@
+import atexit
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+METRICS_DIR_ENV = "CLIO_METRICS_DIR"
+
+Dump = Dict[str, Dict[str, Any]]
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiProcessStore:
+    """
+    多进程(uvicorn --workers N)指标聚合, 每个进程定期把自己的指标写到目录下的 metrics-<pid>.json,
+    抓取时读取所有进程的文件合并, 计数器与直方图累加, 已退出进程的计数也保留, 保证计数器不会变小
+    目录需要在服务启动前清空, 否则会累加上次运行的计数
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dump_func: Callable[[], Dump],
+        flush_interval: float = 5.0,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dump_func = dump_func
+        self.flush_interval = flush_interval
+        self._pid = 0
+        self._lock = threading.Lock()
+        self._ensure_flusher()
+        atexit.register(self.flush)
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def _ensure_flusher(self):
+        """每个进程一个后台写文件线程, fork出的子进程中重新启动"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(
+                target=self._run, name="clio-metrics-flush", daemon=True
+            ).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """把当前进程的指标写入文件, 先写临时文件再替换, 读取方不会读到一半的内容"""
+        pid = os.getpid()
+        path = self._path(pid)
+        temp = f"{path}.tmp"
+        try:
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(self.dump_func(), f, separators=(",", ":"))
+            os.replace(temp, path)
+        except Exception as e:
+            sys.stderr.write(f"write metrics file {path} error: {e}\n")
+
+    def read_all(self) -> List[Tuple[int, Dump]]:
+        dumps = []
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                pid = int(os.path.basename(path)[len("metrics-") : -len(".json")])
+                with open(path, "r", encoding="utf-8") as f:
+                    dumps.append((pid, json.load(f)))
+            except (ValueError, OSError):
+                continue
+        return dumps
+
+    def collect(self) -> Dump:
+        self._ensure_flusher()
+        self.flush()
+        return merge_dumps(self.read_all())
+
+
+def _merge_histogram(target: Optional[Dict[str, Any]], value: Dict[str, Any]):
+    if target is None:
+        return {
+            "counts": list(value["counts"]),
+            "count": value["count"],
+            "sum": value["sum"],
+            "max": value["max"],
+        }
+    if len(target["counts"]) == len(value["counts"]):
+        target["counts"] = [a + b for a, b in zip(target["counts"], value["counts"])]
+        target["count"] += value["count"]
+        target["sum"] += value["sum"]
+        target["max"] = max(target["max"], value["max"])
+    return target
+
+
+def _merge_gauge(mode: str, target: Optional[float], value: float) -> float:
+    if target is None:
+        return value
+    if mode == "max":
+        return max(target, value)
+    if mode == "min":
+        return min(target, value)
+    return target + value
+
+
+def merge_dumps(dumps: List[Tuple[int, Dump]]) -> Dump:
+    """合并多个进程的指标"""
+    merged: Dump = {}
+    merged_values: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+    for pid, dump in sorted(dumps):
+        alive = None
+        for name, family in dump.items():
+            target = merged.get(name)
+            if target is None:
+                target = {k: v for k, v in family.items() if k != "values"}
+                if (
+                    family["type"] == "gauge"
+                    and family.get("multiprocess_mode") == "all"
+                ):
+                    target["label_names"] = list(family["label_names"]) + ["pid"]
+                merged[name] = target
+                merged_values[name] = {}
+            elif target["type"] != family["type"]:
+                continue
+            values = merged_values[name]
+            metric_type = family["type"]
+            mode = family.get("multiprocess_mode", "sum")
+            if metric_type == "gauge":
+                if alive is None:
+                    alive = _pid_alive(pid)
+                if not alive:
+                    continue
+            for label_values, value in family["values"]:
+                key = tuple(label_values)
+                if metric_type == "counter":
+                    values[key] = values.get(key, 0.0) + value
+                elif metric_type == "histogram":
+                    values[key] = _merge_histogram(values.get(key), value)
+                elif mode == "all":
+                    values[key + (str(pid),)] = value
+                else:
+                    values[key] = _merge_gauge(mode, values.get(key), value)
+    for name, target in merged.items():
+        target["values"] = [[list(k), v] for k, v in merged_values[name].items()]
+    return merged
@@ -0,0 +1,106 @@
+import os
+from typing import Any, Dict, Optional, Sequence
+
+from .exposition import render_prometheus
+from .metrics import DEFAULT_LATENCY_BUCKETS, Counter, Gauge, Histogram, Metric
+from .multiprocess import METRICS_DIR_ENV, MultiProcessStore
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表, 同名指标只创建一次
+    多进程部署时调用enable_multiprocess, 或设置环境变量CLIO_METRICS_DIR, 抓取时聚合所有进程的指标
+    """
+
+    _metrics: Dict[str, Metric] = {}
+    _multiprocess: Optional[MultiProcessStore] = None
+
+    @staticmethod
+    def _get_or_create(cls, name: str, *args, **kwargs) -> Any:
+        metric = MetricsRegistry._metrics.get(name)
+        if metric is None:
+            metric = cls(name, *args, **kwargs)
+            metric = MetricsRegistry._metrics.setdefault(name, metric)
+        if not isinstance(metric, cls):
+            raise ValueError(f"metric {name} already registered as {metric.type}")
+        return metric
+
+    @staticmethod
+    def counter(
+        name: str, description: str = "", label_names: Sequence[str] = ()
+    ) -> Counter:
+        return MetricsRegistry._get_or_create(Counter, name, description, label_names)
+
+    @staticmethod
+    def gauge(
+        name: str,
+        description: str = "",
+        label_names: Sequence[str] = (),
+        multiprocess_mode: str = "sum",
+    ) -> Gauge:
+        return MetricsRegistry._get_or_create(
+            Gauge, name, description, label_names, multiprocess_mode
+        )
+
+    @staticmethod
+    def histogram(
+        name: str,
+        description: str = "",
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return MetricsRegistry._get_or_create(
+            Histogram, name, description, label_names, buckets
+        )
+
+    @staticmethod
+    def get(name: str) -> Optional[Metric]:
+        return MetricsRegistry._metrics.get(name)
+
+    @staticmethod
+    def snapshot() -> Dict[str, Any]:
+        """当前进程所有指标的当前值, 直方图给出count/sum/avg/max/p50/p95/p99"""
+        return {
+            name: metric.summary() for name, metric in MetricsRegistry._metrics.items()
+        }
+
+    @staticmethod
+    def dump() -> Dict[str, Dict[str, Any]]:
+        """当前进程所有指标的可序列化数据"""
+        return {
+            name: metric.dump()
+            for name, metric in list(MetricsRegistry._metrics.items())
+        }
+
+    @staticmethod
+    def enable_multiprocess(
+        directory: Optional[str] = None, flush_interval: float = 5.0
+    ) -> MultiProcessStore:
+        """每个进程都需要调用, directory默认取环境变量CLIO_METRICS_DIR"""
+        directory = directory or os.environ.get(METRICS_DIR_ENV)
+        if not directory:
+            raise ValueError(f"metrics directory is required, or set {METRICS_DIR_ENV}")
+        MetricsRegistry._multiprocess = MultiProcessStore(
+            directory, MetricsRegistry.dump, flush_interval
+        )
+        return MetricsRegistry._multiprocess
+
+    @staticmethod
+    def collect() -> Dict[str, Dict[str, Any]]:
+        """开启多进程聚合时返回所有进程合并后的指标, 否则返回当前进程的指标"""
+        if MetricsRegistry._multiprocess is not None:
+            return MetricsRegistry._multiprocess.collect()
+        return MetricsRegistry.dump()
+
+    @staticmethod
+    def render() -> str:
+        """Prometheus文本格式"""
+        return render_prometheus(MetricsRegistry.collect())
+
+    @staticmethod
+    def clear():
+        MetricsRegistry._metrics.clear()
+
+
+if os.environ.get(METRICS_DIR_ENV):
+    MetricsRegistry.enable_multiprocess()
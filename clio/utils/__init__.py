@@ -1,4 +1,13 @@
-from .json_util import hack_json, object_to_json, pretty_json, short_json
+from .json_util import (
+    JSON_BACKEND_MSGSPEC,
+    JSON_BACKEND_ORJSON,
+    JSON_BACKEND_STDLIB,
+    JsonSerializer,
+    hack_json,
+    object_to_json,
+    pretty_json,
+    short_json,
+)
 from .singleton import AbstractSingleton, Singleton
 
 __all__ = [
@@ -10,4 +19,8 @@ __all__ = [
     "pretty_json",
     "short_json",
     "hack_json",
+    "JsonSerializer",
+    "JSON_BACKEND_ORJSON",
+    "JSON_BACKEND_MSGSPEC",
+    "JSON_BACKEND_STDLIB",
 ]
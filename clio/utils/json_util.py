@@ -1,11 +1,268 @@
+import dataclasses
+import datetime
 import json
+import operator
+from decimal import Decimal
 from json import JSONEncoder
-from typing import Any, Callable, Dict, Optional, Set, Union
+from typing import Any, Callable, Dict, Optional, Set, Tuple, Union
 
 from fastapi.encoders import jsonable_encoder
+from pydantic_core import PydanticSerializationError
+
+from clio.pydantics import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
 
 IncEx = Union[Set[int], Set[str], Dict[int, Any], Dict[str, Any]]
 
+JSON_BACKEND_ORJSON = "orjson"
+JSON_BACKEND_MSGSPEC = "msgspec"
+JSON_BACKEND_STDLIB = "stdlib"
+
+
+# 每个类型编译好的编码函数, 第一次遇到该类型时生成, 之后不再判断类型与查找方法
+_TYPE_ENCODERS: Dict[type, Callable[[Any], Any]] = {}
+# object_to_json对pydantic模型使用include/exclude等参数时, 按(类型, 参数)缓存的编码函数
+_MODEL_ENCODERS: Dict[Tuple[Any, ...], Callable[[Any], Any]] = {}
+# 动态创建的类型过多时清空缓存, 避免无限增长
+_MAX_CACHED_TYPES = 4096
+
+
+def _encode_decimal(obj: Decimal) -> Union[int, float]:
+    # 与jsonable_encoder一致, 整数输出int, 否则输出float
+    return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+
+
+def _encode_sqlalchemy_model(obj: Any) -> Dict[str, Any]:
+    # SQLAlchemy的ORM对象, 去掉_sa开头的内部状态
+    return {k: v for k, v in obj.__dict__.items() if not k.startswith("_sa")}
+
+
+def _encode_sqlalchemy_row(obj: Any) -> Dict[str, Any]:
+    return dict(obj._mapping)
+
+
+def _dataclass_encoder(cls: type) -> Callable[[Any], Dict[str, Any]]:
+    names = tuple(f.name for f in dataclasses.fields(cls))
+    if not names:
+        return lambda obj: {}
+    if len(names) == 1:
+        name = names[0]
+        return lambda obj: {name: getattr(obj, name)}
+    getter = operator.attrgetter(*names)
+    return lambda obj: dict(zip(names, getter(obj)))
+
+
+def _pydantic_encoder(cls: type, **kwargs: Any) -> Callable[[Any], Any]:
+    """
+    与jsonable_encoder一致使用json模式, field_serializer(when_used="json")等json模式的配置生效
+    字段中有pydantic不能json序列化的对象时退回python模式, 由序列化器继续编码
+    """
+    to_python = cls.__pydantic_serializer__.to_python
+
+    def encode(obj: Any) -> Any:
+        try:
+            return to_python(obj, mode="json", **kwargs)
+        except PydanticSerializationError:
+            return to_python(obj, **kwargs)
+
+    return encode
+
+
+def _compile_encoder(cls: type) -> Callable[[Any], Any]:
+    """
+    生成类型的编码函数, 返回值中的其它对象由序列化器继续递归处理
+    顺序与object_to_json一致: to_dict/to_json, pydantic, SQLAlchemy, 最后交给jsonable_encoder
+    _json_encode是clio内部类型(HttpResponse)的钩子, 返回值由序列化器继续编码, 优先于to_dict/to_json
+    在类上查找方法, 避免pydantic模型的__getattr__
+    """
+    if getattr(cls, "_json_encode", None) is not None:
+        return operator.methodcaller("_json_encode")
+    if getattr(cls, "to_dict", None) is not None:
+        return operator.methodcaller("to_dict")
+    if getattr(cls, "to_json", None) is not None:
+        return operator.methodcaller("to_json")
+    if issubclass(cls, BaseModel):
+        return _pydantic_encoder(cls, by_alias=True)
+    if getattr(cls, "_mapping", None) is not None:
+        # SQLAlchemy查询返回的Row
+        return _encode_sqlalchemy_row
+    if hasattr(cls, "_sa_class_manager"):
+        return _encode_sqlalchemy_model
+    if dataclasses.is_dataclass(cls):
+        return _dataclass_encoder(cls)
+    if issubclass(cls, (datetime.datetime, datetime.date, datetime.time)):
+        return cls.isoformat
+    if issubclass(cls, Decimal):
+        return _encode_decimal
+    return jsonable_encoder
+
+
+def _encode_default(obj: Any) -> Any:
+    """序列化器不支持的类型, 使用按类型缓存的编码函数转换为可以序列化的对象"""
+    cls = type(obj)
+    encoder = _TYPE_ENCODERS.get(cls)
+    if encoder is None:
+        if len(_TYPE_ENCODERS) >= _MAX_CACHED_TYPES:
+            _TYPE_ENCODERS.clear()
+        encoder = _TYPE_ENCODERS[cls] = _compile_encoder(cls)
+    return encoder(obj)
+
+
+_JSON_PRIMITIVES = frozenset((str, int, float, bool, type(None)))
+
+
+def _to_jsonable(obj: Any) -> Any:
+    """
+    object_to_json默认参数时使用, 用按类型缓存的编码函数逐层转换,
+    结果与jsonable_encoder一致: int类型的key, NaN, 超过64位的整数原样保留, 去掉_sa开头的key
+    """
+    cls = type(obj)
+    if cls in _JSON_PRIMITIVES:
+        return obj
+    if cls is dict:
+        return {
+            (k if type(k) in _JSON_PRIMITIVES else _to_jsonable(k)): _to_jsonable(v)
+            for k, v in obj.items()
+            if not (type(k) is str and k.startswith("_sa"))
+        }
+    if cls is list or cls is tuple:
+        return [_to_jsonable(v) for v in obj]
+    return _to_jsonable(_encode_default(obj))
+
+
+def _freeze(value: Any) -> Any:
+    """include/exclude转换为可以hash的缓存key"""
+    if isinstance(value, dict):
+        return frozenset((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return frozenset(_freeze(v) for v in value)
+    return value
+
+
+def _model_encoder(
+    cls: type,
+    include: Optional[IncEx],
+    exclude: Optional[IncEx],
+    by_alias: bool,
+    exclude_unset: bool,
+    exclude_defaults: bool,
+    exclude_none: bool,
+) -> Callable[[Any], Any]:
+    encoder = _pydantic_encoder(
+        cls,
+        include=include,
+        exclude=exclude,
+        by_alias=by_alias,
+        exclude_unset=exclude_unset,
+        exclude_defaults=exclude_defaults,
+        exclude_none=exclude_none,
+    )
+    try:
+        key = (
+            cls,
+            _freeze(include),
+            _freeze(exclude),
+            by_alias,
+            exclude_unset,
+            exclude_defaults,
+            exclude_none,
+        )
+        hash(key)
+    except TypeError:
+        return encoder
+    cached = _MODEL_ENCODERS.get(key)
+    if cached is None:
+        if len(_MODEL_ENCODERS) >= _MAX_CACHED_TYPES:
+            _MODEL_ENCODERS.clear()
+        cached = _MODEL_ENCODERS[key] = encoder
+    return cached
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(
+        obj, default=_encode_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(
+            obj, default=_encode_default, option=orjson.OPT_NON_STR_KEYS
+        )
+    except orjson.JSONEncodeError:
+        # 超过64位的整数等orjson不支持的内容
+        return _stdlib_dumps(obj)
+
+
+def _create_msgspec_dumps() -> Callable[[Any], bytes]:
+    encoder = msgspec.json.Encoder(enc_hook=_encode_default, decimal_format="number")
+    return encoder.encode
+
+
+class JsonSerializer:
+    """
+    json序列化后端, 默认按 orjson, msgspec, 标准库json 的顺序使用已安装的第一个
+    dumps返回utf-8编码的bytes, 原生支持dataclass, datetime, uuid, enum,
+    pydantic模型, SQLAlchemy的Row与ORM对象, 以及有to_dict/to_json方法的对象
+
+    JsonSerializer.set_backend("stdlib")
+    body = JsonSerializer.dumps(HttpResponse.success(rows))
+    """
+
+    _backend: str = JSON_BACKEND_STDLIB
+    _dumps: Callable[[Any], bytes] = staticmethod(_stdlib_dumps)
+    _loads: Callable[[Union[str, bytes]], Any] = staticmethod(json.loads)
+
+    @staticmethod
+    def set_backend(backend: Optional[str] = None):
+        """backend为None时自动选择"""
+        if backend is None:
+            if orjson is not None:
+                backend = JSON_BACKEND_ORJSON
+            elif msgspec is not None:
+                backend = JSON_BACKEND_MSGSPEC
+            else:
+                backend = JSON_BACKEND_STDLIB
+        if backend == JSON_BACKEND_ORJSON:
+            if orjson is None:
+                raise ValueError("orjson is not installed")
+            dumps, loads = _orjson_dumps, orjson.loads
+        elif backend == JSON_BACKEND_MSGSPEC:
+            if msgspec is None:
+                raise ValueError("msgspec is not installed")
+            dumps, loads = _create_msgspec_dumps(), msgspec.json.decode
+        elif backend == JSON_BACKEND_STDLIB:
+            dumps, loads = _stdlib_dumps, json.loads
+        else:
+            raise ValueError(f"unknown json backend {backend}")
+        JsonSerializer._backend = backend
+        JsonSerializer._dumps = staticmethod(dumps)
+        JsonSerializer._loads = staticmethod(loads)
+
+    @staticmethod
+    def backend() -> str:
+        return JsonSerializer._backend
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:
+        return JsonSerializer._dumps(obj)
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        return JsonSerializer._loads(data)
+
+
+JsonSerializer.set_backend()
+
 
 def object_to_json(
     obj: Any,
@@ -46,10 +303,37 @@ def object_to_json(
     """
     if obj is None:
         return None
-    if hasattr(obj, "to_dict"):
-        return obj.to_dict()
-    if hasattr(obj, "to_json"):
-        return obj.to_json()
+    cls = type(obj)
+    has_to_dict = getattr(cls, "to_dict", None) is not None
+    has_to_json = not has_to_dict and getattr(cls, "to_json", None) is not None
+    if custom_encoder is None and sqlalchemy_safe:
+        if (
+            include is None
+            and exclude is None
+            and by_alias
+            and not exclude_unset
+            and not exclude_defaults
+            and not exclude_none
+        ):
+            # 默认参数时使用按类型缓存的编码函数, 比jsonable_encoder逐个对象判断类型快得多
+            return _to_jsonable(obj)
+        if not has_to_dict and not has_to_json and issubclass(cls, BaseModel):
+            encoder = _model_encoder(
+                cls,
+                include,
+                exclude,
+                by_alias,
+                exclude_unset,
+                exclude_defaults,
+                exclude_none,
+            )
+            return _to_jsonable(encoder(obj))
+    if has_to_dict:
+        obj = obj.to_dict()
+        include = exclude = None
+    elif has_to_json:
+        obj = obj.to_json()
+        include = exclude = None
     return jsonable_encoder(
         obj,
         include=include,
@@ -77,4 +361,4 @@ def pretty_json(obj):
 
 
 def short_json(o):
-    return json.dumps(o, ensure_ascii=False, separators=(",", ":"))
+    return JsonSerializer.dumps(o).decode("utf-8")
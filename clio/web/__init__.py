@@ -1,12 +1,33 @@
 from .exception import BusinessException, RpcException
 from .http_client import (
+    DEFAULT_POOL_NAME,
+    CircuitBreaker,
+    CircuitOpenException,
+    DownloadManager,
+    DownloadProgress,
+    DownloadResult,
+    DownloadSummary,
+    HttpCallTiming,
+    HttpClientPool,
     HttpException,
+    RateLimiter,
+    RateLimiterRegistry,
+    RateLimitExceededException,
     RawResponse,
+    ResponseCache,
+    ResponseTooLargeException,
+    RetryBudget,
+    RetryPolicy,
+    current_http_timings,
     default_valid_status,
     download_file,
+    http_client_lifespan,
     http_invoke,
+    http_invoke_many,
+    http_stream,
 )
-from .http_response import HttpResponse
+from .http_response import FastJSONResponse, HttpResponse, StreamingHttpResponse
+from .metrics_router import metrics_router
 from .orm import SQLAlchemy
 from .web_initializer import common_exception_handlers
 
@@ -16,14 +37,38 @@ __all__ = [
     "RpcException",
     # HttpResponse
     "HttpResponse",
+    "FastJSONResponse",
+    "StreamingHttpResponse",
     # web initializer
     "common_exception_handlers",
+    # metrics
+    "metrics_router",
     # http
     "RawResponse",
     "HttpException",
     "default_valid_status",
     "http_invoke",
+    "http_invoke_many",
     "download_file",
+    "DownloadProgress",
+    "DownloadManager",
+    "DownloadResult",
+    "DownloadSummary",
+    "DEFAULT_POOL_NAME",
+    "HttpClientPool",
+    "http_client_lifespan",
+    "RetryPolicy",
+    "RetryBudget",
+    "CircuitBreaker",
+    "CircuitOpenException",
+    "ResponseCache",
+    "http_stream",
+    "RateLimiter",
+    "RateLimiterRegistry",
+    "RateLimitExceededException",
+    "HttpCallTiming",
+    "current_http_timings",
+    "ResponseTooLargeException",
     # orm
     "SQLAlchemy",
 ]
@@ -1,15 +1,50 @@
-from .http_client import (
+from .batch import http_invoke_many
+from .cache import ResponseCache
+from .download import DownloadProgress, download_file
+from .download_manager import DownloadManager, DownloadResult, DownloadSummary
+from .exception import (
+    CircuitOpenException,
     HttpException,
-    RawResponse,
-    default_valid_status,
-    download_file,
-    http_invoke,
+    RateLimitExceededException,
 )
+from .http_client import RawResponse, default_valid_status, http_invoke
+from .pool import DEFAULT_POOL_NAME, HttpClientPool, http_client_lifespan
+from .rate_limit import RateLimiter, RateLimiterRegistry
+from .retry import CircuitBreaker, RetryBudget, RetryPolicy
+from .stream import JsonArrayParser, ResponseTooLargeException, http_stream
+from .timing import HttpCallTiming, current_http_timings
 
 __all__ = [
     "http_invoke",
+    "http_invoke_many",
     "download_file",
+    "DownloadProgress",
+    "DownloadManager",
+    "DownloadResult",
+    "DownloadSummary",
     "RawResponse",
     "HttpException",
     "default_valid_status",
+    # pool
+    "DEFAULT_POOL_NAME",
+    "HttpClientPool",
+    "http_client_lifespan",
+    # retry
+    "RetryPolicy",
+    "RetryBudget",
+    "CircuitBreaker",
+    "CircuitOpenException",
+    # cache
+    "ResponseCache",
+    # rate limit
+    "RateLimiter",
+    "RateLimiterRegistry",
+    "RateLimitExceededException",
+    # stream
+    "http_stream",
+    "JsonArrayParser",
+    "ResponseTooLargeException",
+    # timing
+    "HttpCallTiming",
+    "current_http_timings",
 ]
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Union
+
+from .http_client import HttpException, RawResponse, http_invoke
+from .rate_limit import url_host
+
+
+async def http_invoke_many(
+    requests: List[Dict[str, Any]],
+    concurrency: int = 10,
+    per_host_concurrency: Optional[int] = None,
+    fail_fast: bool = False,
+    **common_kwargs: Any,
+) -> List[Union[RawResponse, Exception]]:
+    """
+    并发执行多个http_invoke, 结果顺序与requests一致
+
+    requests: 每一项是http_invoke的参数, 如 {"url": "...", "method": "POST", "json": {...}}
+    concurrency: 全局最大并发数
+    per_host_concurrency: 单个host的最大并发数, 为None时不限制
+    fail_fast: 为True时遇到第一个失败即取消其余请求并抛出该异常,
+        为False时收集所有结果, 失败项为对应的异常, 通常是HttpException, 参数错误等其他异常也放在对应位置
+    common_kwargs: 所有请求共用的http_invoke参数, 单个请求中的同名参数优先
+    """
+    if concurrency <= 0:
+        raise ValueError("concurrency must be greater than 0")
+    if per_host_concurrency is not None and per_host_concurrency <= 0:
+        raise ValueError("per_host_concurrency must be greater than 0")
+
+    global_semaphore = asyncio.Semaphore(concurrency)
+    host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def host_semaphore(url: str) -> Optional[asyncio.Semaphore]:
+        if per_host_concurrency is None:
+            return None
+        host = url_host(url)
+        semaphore = host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(per_host_concurrency)
+            host_semaphores[host] = semaphore
+        return semaphore
+
+    async def invoke(spec: Dict[str, Any]) -> Union[RawResponse, Exception]:
+        kwargs = {**common_kwargs, **spec}
+        url = kwargs.get("url")
+        if not url:
+            error = HttpException("request url is empty")
+            if fail_fast:
+                raise error
+            return error
+        semaphore = host_semaphore(url)
+        try:
+            if semaphore is None:
+                async with global_semaphore:
+                    return await http_invoke(**kwargs)
+            async with semaphore, global_semaphore:
+                return await http_invoke(**kwargs)
+        except Exception as e:
+            if fail_fast:
+                raise
+            return e
+
+    tasks = [asyncio.ensure_future(invoke(spec)) for spec in requests]
+    if not tasks:
+        return []
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
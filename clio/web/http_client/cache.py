@@ -0,0 +1,189 @@
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Collection, Dict, Optional, Tuple
+
+import httpx
+
+from .http_client import RawResponse
+
+# 携带用户凭证的请求头总是参与缓存key的计算, 不同用户的响应不会互相命中
+_CREDENTIAL_HEADERS = ("authorization", "proxy-authorization", "cookie")
+
+# (method, url, response_type, validate_status, vary)
+CacheKey = Tuple[str, str, str, Any, Tuple[Tuple[str, str], ...]]
+
+
+class _CacheEntry:
+    __slots__ = ("response", "expires_at", "etag", "last_modified")
+
+    def __init__(
+        self,
+        response: RawResponse,
+        expires_at: float,
+        etag: Optional[str],
+        last_modified: Optional[str],
+    ):
+        self.response = response
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def can_revalidate(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+
+def _parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    if not value:
+        return directives
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+class ResponseCache:
+    """
+    http_invoke GET请求的进程内响应缓存, TTL + LRU淘汰
+
+    max_entries: 最多缓存的响应数, 超出后淘汰最久未使用的
+    ttl: 默认缓存时间, 秒, 响应中的Cache-Control: max-age优先
+    vary_headers: 参与缓存key计算的请求头, Authorization, Proxy-Authorization, Cookie总是参与计算,
+        携带不同凭证的请求各自缓存, 不会把一个用户的响应返回给另一个用户
+    respect_cache_control: 遵守响应的Cache-Control, no-store不缓存, no-cache每次都重新验证
+    相同key的并发请求只会发出一次上游调用, 其余请求等待并共享结果
+    只缓存2xx响应, response_type与validate_status参与缓存key的计算,
+    validate_status每次传入新的lambda时无法命中缓存
+    每次返回的都是body的副本, 调用方修改不会影响缓存
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 60.0,
+        vary_headers: Collection[str] = (),
+        respect_cache_control: bool = True,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be greater than 0")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.vary_headers = tuple(
+            sorted({h.lower() for h in vary_headers}.union(_CREDENTIAL_HEADERS))
+        )
+        self.respect_cache_control = respect_cache_control
+        self._entries: OrderedDict[CacheKey, _CacheEntry] = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self.coalesced = 0
+
+    def key(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        response_type: str = "json",
+        validate_status: Optional[Callable[[int], bool]] = None,
+    ) -> CacheKey:
+        vary: Tuple[Tuple[str, str], ...] = ()
+        if self.vary_headers and headers:
+            lower_headers = {k.lower(): v for k, v in headers.items()}
+            vary = tuple((h, lower_headers.get(h, "")) for h in self.vary_headers)
+        return method.upper(), url, response_type, validate_status, vary
+
+    @staticmethod
+    def copy_response(response: RawResponse) -> RawResponse:
+        """返回给调用方的副本, json解析出的dict/list是可变的, 不能与缓存共享"""
+        body = response.body
+        if isinstance(body, (dict, list)):
+            body = copy.deepcopy(body)
+        return RawResponse(response.headers, body, response.status_code)
+
+    def get(self, key: CacheKey) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: CacheKey, response: RawResponse):
+        if not 200 <= response.status_code < 300:
+            # validate_status放行的非2xx响应(如404)不缓存
+            self.invalidate(key)
+            return
+        headers = response.headers or {}
+        ttl = self.ttl
+        if self.respect_cache_control:
+            directives = _parse_cache_control(headers.get("cache-control"))
+            if "no-store" in directives:
+                self.invalidate(key)
+                return
+            if "no-cache" in directives:
+                ttl = 0
+            elif directives.get("max-age") is not None:
+                try:
+                    ttl = float(directives["max-age"])  # type: ignore[arg-type]
+                except ValueError:
+                    pass
+        entry = _CacheEntry(
+            response,
+            time.monotonic() + ttl,
+            headers.get("etag"),
+            headers.get("last-modified"),
+        )
+        if ttl <= 0 and not entry.can_revalidate():
+            self.invalidate(key)
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def refresh(self, key: CacheKey, entry: _CacheEntry, headers=None):
+        """上游返回304, 沿用缓存的body, 用304响应头更新缓存策略与过期时间"""
+        response = entry.response
+        if headers:
+            merged_headers = httpx.Headers(response.headers)
+            merged_headers.update(headers)
+            response = RawResponse(merged_headers, response.body, response.status_code)
+        self.put(key, response)
+
+    def invalidate(self, key: CacheKey):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def coalesce(
+        self, key: CacheKey, loader: Callable[[], Awaitable[RawResponse]]
+    ) -> RawResponse:
+        """相同key的并发请求共享一次loader调用, 调用方被取消不会影响其它等待者"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "revalidations": self.revalidations,
+            "coalesced": self.coalesced,
+        }
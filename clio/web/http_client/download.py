@@ -0,0 +1,497 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional
+
+import aiofiles
+import httpx
+
+from clio.context import run_in_threadpool_with_context
+from clio.context.trace import trace_context
+from clio.logger import Log
+
+from .exception import HttpException
+from .pool import DEFAULT_POOL_NAME, HttpClientPool
+from .timing import HttpCallTiming, record_http_timing
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+_FLUSH_INTERVAL_CHUNKS = 8
+_STATE_SAVE_INTERVAL = 1.0
+_PROGRESS_INTERVAL = 0.5
+
+
+class DownloadProgress:
+    def __init__(
+        self,
+        url: str,
+        downloaded: int,
+        total: Optional[int],
+        elapsed: float,
+        bytes_per_second: float,
+        done: bool = False,
+    ):
+        self.url = url
+        self.downloaded = downloaded
+        self.total = total
+        self.elapsed = elapsed
+        self.bytes_per_second = bytes_per_second
+        self.done = done
+
+
+ProgressCallback = Callable[[DownloadProgress], None]
+
+
+class _ProgressTracker:
+    def __init__(
+        self,
+        url: str,
+        total: Optional[int],
+        initial: int,
+        callback: Optional[ProgressCallback],
+    ):
+        self.url = url
+        self.total = total
+        self.initial = initial
+        self.downloaded = initial
+        self.callback = callback
+        self.start_time = time.monotonic()
+        self._last_report = self.start_time
+
+    def advance(self, size: int):
+        self.downloaded += size
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if now - self._last_report >= _PROGRESS_INTERVAL:
+            self._last_report = now
+            self.callback(self.progress(now))
+
+    def progress(self, now: float, done: bool = False) -> DownloadProgress:
+        elapsed = now - self.start_time
+        transferred = self.downloaded - self.initial
+        speed = transferred / elapsed if elapsed > 0 else 0.0
+        return DownloadProgress(
+            self.url, self.downloaded, self.total, elapsed, speed, done
+        )
+
+    def finish(self) -> DownloadProgress:
+        progress = self.progress(time.monotonic(), done=True)
+        if self.callback is not None:
+            self.callback(progress)
+        return progress
+
+
+class _Segment:
+    __slots__ = ("start", "end", "downloaded", "persisted")
+
+    def __init__(self, start: int, end: int, downloaded: int = 0):
+        self.start = start
+        # end是包含的, 与http Range一致
+        self.end = end
+        self.downloaded = downloaded
+        self.persisted = downloaded
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    @property
+    def finished(self) -> bool:
+        return self.downloaded >= self.size
+
+
+class _DownloadState:
+    """
+    分段下载的进度, 保存在{save_path}.temp.state中, 中断后据此从.temp文件续传
+    只记录已经flush到.temp文件的字节数
+    """
+
+    def __init__(
+        self,
+        url: str,
+        total: int,
+        validator: Optional[str],
+        segments: List[_Segment],
+    ):
+        self.url = url
+        self.total = total
+        self.validator = validator
+        self.segments = segments
+        self._last_save = 0.0
+        self._save_lock = asyncio.Lock()
+
+    @staticmethod
+    def create(
+        url: str, total: int, validator: Optional[str], connections: int, min_size: int
+    ) -> "_DownloadState":
+        count = max(1, min(connections, -(-total // max(min_size, 1))))
+        segment_size = -(-total // count)
+        segments = []
+        for start in range(0, total, segment_size):
+            segments.append(_Segment(start, min(start + segment_size, total) - 1))
+        return _DownloadState(url, total, validator, segments)
+
+    @staticmethod
+    def load(path: str) -> Optional["_DownloadState"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            segments = [_Segment(*s) for s in raw["segments"]]
+            return _DownloadState(raw["url"], raw["total"], raw["validator"], segments)
+        except Exception:
+            return None
+
+    @property
+    def downloaded(self) -> int:
+        return sum(s.persisted for s in self.segments)
+
+    async def save(self, path: str, force: bool = False):
+        """在事件循环中取进度快照, 在线程池中写文件, 同一时间只有一个写入"""
+        now = time.monotonic()
+        if not force and now - self._last_save < _STATE_SAVE_INTERVAL:
+            return
+        self._last_save = now
+        raw = {
+            "url": self.url,
+            "total": self.total,
+            "validator": self.validator,
+            "segments": [[s.start, s.end, s.persisted] for s in self.segments],
+        }
+        async with self._save_lock:
+            await run_in_threadpool_with_context(_write_json, path, raw)
+
+
+def _write_json(path: str, raw: Dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(raw, f)
+
+
+def _preallocate(path: str, size: int):
+    """预分配文件, 各分段直接写入自己的偏移"""
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+class _ResourceChanged(HttpException):
+    """带If-Range的分段请求返回了200, 说明文件已经变化, 需要从头下载"""
+
+
+def _remove_quietly(*paths: str):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            Log.warn(f"remove file[{path}] error: {e}")
+
+
+def _file_digest(path: str, algorithm: str, chunk_size: int) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _range_validator(headers: httpx.Headers) -> Optional[str]:
+    """If-Range只能使用强ETag, 弱ETag(W/"...")时使用Last-Modified"""
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
+
+
+async def _probe(client: httpx.AsyncClient, url: str, headers: Dict[str, str]):
+    """返回(文件大小, 是否支持Range, 强ETag/Last-Modified), 探测失败时返回(None, False, None)"""
+    try:
+        response = await client.head(url, headers=headers, follow_redirects=True)
+    except httpx.HTTPError:
+        return None, False, None
+    if response.status_code != 200:
+        return None, False, None
+    total = response.headers.get("content-length")
+    accept_ranges = response.headers.get("accept-ranges", "").lower() == "bytes"
+    validator = _range_validator(response.headers)
+    if total is None or not total.isdigit():
+        return None, False, validator
+    return int(total), accept_ranges and int(total) > 0, validator
+
+
+async def _download_segment(
+    client: httpx.AsyncClient,
+    url: str,
+    temp_file_path: str,
+    segment: _Segment,
+    state: _DownloadState,
+    state_path: str,
+    tracker: _ProgressTracker,
+    chunk_size: int,
+    request_headers: Dict[str, str],
+):
+    if segment.finished:
+        return
+    headers = dict(request_headers)
+    headers["Range"] = f"bytes={segment.start + segment.downloaded}-{segment.end}"
+    if state.validator:
+        headers["If-Range"] = state.validator
+    async with client.stream(
+        "GET", url, headers=headers, follow_redirects=True
+    ) as response:
+        if response.status_code == 200:
+            raise _ResourceChanged(
+                f"download url[{url}] range[{headers['Range']}] returned full content"
+            )
+        if response.status_code != 206:
+            raise HttpException(
+                f"download url[{url}] range[{headers['Range']}] error, "
+                f"status[{response.status_code}]"
+            )
+        fd = await aiofiles.open(temp_file_path, "r+b")
+        try:
+            await fd.seek(segment.start + segment.downloaded)
+            chunks = 0
+            async for chunk in response.aiter_bytes(chunk_size):
+                remaining = segment.size - segment.downloaded
+                if len(chunk) > remaining:
+                    chunk = chunk[:remaining]
+                await fd.write(chunk)
+                segment.downloaded += len(chunk)
+                tracker.advance(len(chunk))
+                chunks += 1
+                if chunks % _FLUSH_INTERVAL_CHUNKS == 0:
+                    await fd.flush()
+                    segment.persisted = segment.downloaded
+                    await state.save(state_path)
+                if segment.finished:
+                    break
+        finally:
+            await fd.close()
+            segment.persisted = segment.downloaded
+    if not segment.finished:
+        raise HttpException(
+            f"download url[{url}] range[{headers['Range']}] error, connection closed early"
+        )
+
+
+async def _download_ranges(
+    client: httpx.AsyncClient,
+    url: str,
+    temp_file_path: str,
+    total: int,
+    validator: Optional[str],
+    connections: int,
+    chunk_size: int,
+    min_segment_size: int,
+    progress: Optional[ProgressCallback],
+    verbose: bool,
+    headers: Dict[str, str],
+) -> _ProgressTracker:
+    state_path = f"{temp_file_path}.state"
+    state = await run_in_threadpool_with_context(_DownloadState.load, state_path)
+    if (
+        state is None
+        or state.url != url
+        or state.total != total
+        or state.validator != validator
+        or not os.path.isfile(temp_file_path)
+        or os.path.getsize(temp_file_path) != total
+    ):
+        state = _DownloadState.create(
+            url, total, validator, connections, min_segment_size
+        )
+        await run_in_threadpool_with_context(_preallocate, temp_file_path, total)
+        await state.save(state_path, force=True)
+    elif verbose:
+        Log.info(f"download url[{url}] resume from {state.downloaded}/{total} bytes")
+
+    tracker = _ProgressTracker(url, total, state.downloaded, progress)
+    tasks = [
+        asyncio.ensure_future(
+            _download_segment(
+                client,
+                url,
+                temp_file_path,
+                segment,
+                state,
+                state_path,
+                tracker,
+                chunk_size,
+                headers,
+            )
+        )
+        for segment in state.segments
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await state.save(state_path, force=True)
+    return tracker
+
+
+async def _download_stream(
+    client: httpx.AsyncClient,
+    url: str,
+    temp_file_path: str,
+    total: Optional[int],
+    chunk_size: int,
+    progress: Optional[ProgressCallback],
+    headers: Dict[str, str],
+) -> _ProgressTracker:
+    tracker = _ProgressTracker(url, total, 0, progress)
+    async with client.stream(
+        "GET", url, headers=headers, follow_redirects=True
+    ) as response:
+        if response.status_code != 200:
+            raise HttpException(
+                f"download url[{url}] error, status[{response.status_code}]"
+            )
+        async with aiofiles.open(temp_file_path, "wb") as fd:
+            async for chunk in response.aiter_bytes(chunk_size):
+                await fd.write(chunk)
+                tracker.advance(len(chunk))
+            await fd.flush()
+    return tracker
+
+
+async def download_file(
+    url: str,
+    save_path,
+    delete_if_exists: bool = False,
+    verbose: bool = True,
+    client: Optional[httpx.AsyncClient] = None,
+    pool_name: str = DEFAULT_POOL_NAME,
+    connections: int = 4,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    min_segment_size: int = DEFAULT_MIN_SEGMENT_SIZE,
+    checksum: Optional[str] = None,
+    checksum_algorithm: str = "sha256",
+    progress: Optional[ProgressCallback] = None,
+) -> Optional[DownloadProgress]:
+    """
+    下载文件到save_path, 先写入{save_path}.temp, 完成后重命名
+
+    connections: 服务端支持Range时, 最多拆分成多少个分段并发下载
+    chunk_size: 每次读取写入的字节数
+    min_segment_size: 单个分段的最小字节数, 小文件不拆分
+    checksum: 文件的摘要(hex), 下载完成后校验, 不一致时删除临时文件并抛出HttpException
+    progress: 进度回调, 大约每0.5s调用一次, 结束时再调用一次
+    服务端支持Range时, 中断后再次调用会从.temp文件续传
+    文件已存在且不删除时跳过, 返回None, 否则返回最终的下载进度
+    """
+    if not url:
+        raise HttpException("download url is empty")
+
+    if not save_path:
+        raise HttpException("save path is empty")
+
+    if connections <= 0:
+        raise HttpException("connections must be greater than 0")
+
+    exists = os.path.exists(save_path)
+    is_file = os.path.isfile(save_path)
+    if not delete_if_exists and exists and is_file:
+        if verbose:
+            Log.info(f"download url[{url}] to path[{save_path}], file exists, skip")
+        return None
+
+    if exists:
+        try:
+            if is_file:
+                os.remove(save_path)
+            else:
+                shutil.rmtree(save_path)
+        except Exception as e:
+            raise HttpException(f"delete file[{save_path}] error", e)
+
+    temp_file_path = f"{save_path}.temp"
+    state_path = f"{temp_file_path}.state"
+
+    if client is None:
+        client = HttpClientPool.get_client(pool_name)
+    # 要求上游不压缩, Content-Length与Range都对应文件本身的字节
+    headers: Dict[str, str] = {"Accept-Encoding": "identity"}
+    trace_context.patch_http_invoke(headers)
+    timing = HttpCallTiming("GET", url)
+    try:
+        total, accept_ranges, validator = await _probe(client, url, headers)
+        tracker = None
+        if accept_ranges and total is not None:
+            try:
+                tracker = await _download_ranges(
+                    client,
+                    url,
+                    temp_file_path,
+                    total,
+                    validator,
+                    connections,
+                    chunk_size,
+                    min_segment_size,
+                    progress,
+                    verbose,
+                    headers,
+                )
+            except _ResourceChanged:
+                # 分段下载期间文件发生了变化, 已下载的分段作废
+                if verbose:
+                    Log.info(f"download url[{url}] changed, restart from 0")
+        if tracker is None:
+            _remove_quietly(state_path)
+            tracker = await _download_stream(
+                client, url, temp_file_path, total, chunk_size, progress, headers
+            )
+    except Exception as e:
+        timing.finish(error=e)
+        record_http_timing(timing, verbose)
+        if isinstance(e, HttpException):
+            raise e
+        else:
+            raise HttpException(f"download url[{url}] to path[{save_path}] error", e)
+    timing.body_read()
+    timing.finish(200)
+    record_http_timing(timing, verbose)
+
+    if checksum is not None:
+        try:
+            digest = await run_in_threadpool_with_context(
+                _file_digest, temp_file_path, checksum_algorithm, chunk_size
+            )
+        except Exception as e:
+            raise HttpException(f"checksum file[{temp_file_path}] error", e)
+        if digest.lower() != checksum.lower():
+            _remove_quietly(temp_file_path, state_path)
+            raise HttpException(
+                f"download url[{url}] checksum mismatch, "
+                f"expected[{checksum}], actual[{digest}]"
+            )
+
+    # rename temp file to save path
+    try:
+        os.rename(temp_file_path, save_path)
+    except Exception as e:
+        _remove_quietly(temp_file_path)
+        raise HttpException(
+            f"rename temp file[{temp_file_path}] to save path[{save_path}] error", e
+        )
+    finally:
+        _remove_quietly(state_path)
+
+    result = tracker.finish()
+    if verbose:
+        Log.info(
+            f"download url[{url}] to path[{save_path}] finished, "
+            f"{result.downloaded} bytes, {result.elapsed:.2f}s, "
+            f"{result.bytes_per_second / 1024 / 1024:.2f}MB/s"
+        )
+    return result
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from clio.logger import Log
+
+from .download import download_file
+from .exception import HttpException
+from .pool import DEFAULT_POOL_NAME, HttpClientPool
+from .rate_limit import url_host
+
+
+class DownloadResult:
+    def __init__(
+        self,
+        url: str,
+        save_path: str,
+        size: int = 0,
+        elapsed: float = 0.0,
+        skipped: bool = False,
+        error: Optional[HttpException] = None,
+    ):
+        self.url = url
+        self.save_path = save_path
+        self.size = size
+        self.elapsed = elapsed
+        self.skipped = skipped
+        self.error = error
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+class DownloadSummary:
+    def __init__(self, results: List[DownloadResult], elapsed: float):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def unique_results(self) -> List[DownloadResult]:
+        # 去重的下载共享同一个DownloadResult, 统计时只计一次
+        return list({id(r): r for r in self.results}.values())
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(r.size for r in self.unique_results)
+
+    @property
+    def failures(self) -> List[DownloadResult]:
+        return [r for r in self.unique_results if r.error is not None]
+
+    @property
+    def skipped(self) -> List[DownloadResult]:
+        return [r for r in self.unique_results if r.skipped]
+
+    def __str__(self):
+        return (
+            f"download {len(self.unique_results)} files, {self.total_bytes} bytes, "
+            f"{len(self.skipped)} skipped, {len(self.failures)} failed, "
+            f"elapsed {self.elapsed:.2f}s"
+        )
+
+
+class DownloadManager:
+    """
+    批量下载, 在download_file之上做去重与并发控制
+
+    concurrency: 全局同时下载的文件数
+    per_host_concurrency: 同一个host同时下载的文件数
+    pool_name: 所有下载共用的HttpClientPool连接池
+    download_kwargs: 透传给download_file的参数, 如connections, checksum_algorithm
+    保存到同一路径的下载只会执行一次, 后来者等待并共享结果, 同一路径对应不同url时报错
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        per_host_concurrency: int = 4,
+        pool_name: str = DEFAULT_POOL_NAME,
+        client: Optional[httpx.AsyncClient] = None,
+        **download_kwargs: Any,
+    ):
+        if concurrency <= 0 or per_host_concurrency <= 0:
+            raise ValueError("concurrency must be greater than 0")
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.pool_name = pool_name
+        self.client = client
+        self.download_kwargs = download_kwargs
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = url_host(url)
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_concurrency)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _download(self, url: str, save_path: str, **kwargs: Any):
+        start_time = time.monotonic()
+        try:
+            async with self._host_semaphore(url), self._semaphore:
+                client = self.client or HttpClientPool.get_client(self.pool_name)
+                progress = await download_file(
+                    url, save_path, client=client, **{**self.download_kwargs, **kwargs}
+                )
+        except HttpException as e:
+            return DownloadResult(
+                url, save_path, elapsed=time.monotonic() - start_time, error=e
+            )
+        if progress is None:
+            return DownloadResult(url, save_path, skipped=True)
+        return DownloadResult(
+            url,
+            save_path,
+            size=progress.downloaded,
+            elapsed=time.monotonic() - start_time,
+        )
+
+    async def download(self, url: str, save_path: str, **kwargs: Any) -> DownloadResult:
+        """下载单个文件, 同一路径正在下载时共享结果, 失败时结果中带有error, 不抛出异常"""
+        key = os.path.abspath(save_path)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            inflight_url, task = inflight
+            if inflight_url != url:
+                return DownloadResult(
+                    url,
+                    save_path,
+                    error=HttpException(
+                        f"save path[{save_path}] is downloading from another url[{inflight_url}]"
+                    ),
+                )
+        else:
+            task = asyncio.ensure_future(self._download(url, save_path, **kwargs))
+            self._inflight[key] = (url, task)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def download_all(
+        self, items: Iterable[Tuple[str, str]], **kwargs: Any
+    ) -> DownloadSummary:
+        """批量下载(url, save_path), 结果顺序与items一致, 重复项共享同一个结果"""
+        start_time = time.monotonic()
+        results = await asyncio.gather(
+            *[self.download(url, save_path, **kwargs) for url, save_path in items]
+        )
+        summary = DownloadSummary(list(results), time.monotonic() - start_time)
+        if summary.failures:
+            Log.warn(str(summary))
+        else:
+            Log.info(str(summary))
+        return summary
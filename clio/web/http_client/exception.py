@@ -0,0 +1,39 @@
+from typing import Optional
+
+
+class HttpException(Exception):
+    def __init__(
+        self,
+        message: str,
+        cause: Optional[Exception] = None,
+        status_code: Optional[int] = None,
+        body: Optional[str] = None,
+    ):
+        super().__init__(message)
+        self.cause = cause
+        self.status_code = status_code
+        self.body = body
+
+    def __str__(self):
+        if self.cause is None:
+            return super().__str__()
+        return f"{super().__str__()}, caused by {self.cause}"
+
+
+class CircuitOpenException(HttpException):
+    """熔断器处于打开状态, 请求没有发送到上游"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(
+            f"circuit breaker of host[{host}] is open, retry after {retry_after:.2f}s"
+        )
+        self.host = host
+        self.retry_after = retry_after
+
+
+class RateLimitExceededException(HttpException):
+    """排队等待限流超时或者等待队列已满, 请求没有发送到上游"""
+
+    def __init__(self, key: str, reason: str):
+        super().__init__(f"rate limit of [{key}] exceeded, {reason}")
+        self.key = key
@@ -1,36 +1,37 @@
 import asyncio
 import hashlib
-import os
-import shutil
-from typing import Any, Callable, Dict, Literal, Optional, Union
+import logging
+import time
+from contextlib import nullcontext
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Literal,
+    Optional,
+    Union,
+)
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
-import aiofiles
 import httpx
 from httpx import URL, Proxy
 
-from clio.logger import Log
-
-ProxiesTypes = Union[URL, str, Proxy]
+from clio.context.span import inject_trace_headers, start_span, tracing_enabled
+from clio.context.trace import trace_context
+from clio.logger import Log, default_logger
 
+from .exception import HttpException
+from .pool import DEFAULT_POOL_NAME, HttpClientPool
+from .rate_limit import RateLimiterRegistry, url_host
+from .timing import HttpCallTiming, record_http_timing
 
-class HttpException(Exception):
-    def __init__(
-        self,
-        message: str,
-        cause: Optional[Exception] = None,
-        status_code: Optional[int] = None,
-        body: Optional[str] = None,
-    ):
-        super().__init__(message)
-        self.cause = cause
-        self.status_code = status_code
-        self.body = body
+if TYPE_CHECKING:
+    from .cache import CacheKey, ResponseCache
+    from .retry import CircuitBreaker, RetryPolicy
 
-    def __str__(self):
-        if self.cause is None:
-            return super().__str__()
-        return f"{super().__str__()}, caused by {self.cause}"
+ProxiesTypes = Union[URL, str, Proxy]
 
 
 class RawResponse:
@@ -80,38 +81,49 @@ def default_valid_status(status_code: int) -> bool:
     return 200 == status_code
 
 
-async def http_invoke(
-    url: str,
-    method: Literal["GET", "POST", "DELETE", "PUT", "HEAD", "OPTIONS"] = "GET",
-    query: Optional[dict[str, Any]] = None,
-    json: Any = None,
-    data: Any = None,
-    response_type: Literal["json", "text"] = "json",
-    headers: Optional[dict[str, str]] = None,
-    timeout: int = 30,
-    verbose: bool = True,
-    validate_status: Optional[Callable[[int], bool]] = default_valid_status,
-    proxies: Optional[ProxiesTypes] = None,
+async def _invoke_once(
+    client: Optional[httpx.AsyncClient],
+    pool_name: str,
+    proxies: Optional[ProxiesTypes],
+    method: str,
+    request_url_str: str,
+    json: Any,
+    data: Any,
+    response_type: str,
+    headers: Optional[dict[str, str]],
+    timeout: int,
+    verbose: bool,
+    validate_status: Optional[Callable[[int], bool]],
+    accept_not_modified: bool = False,
 ) -> RawResponse:
+    if client is None and proxies is None:
+        client = HttpClientPool.get_client(pool_name)
+    timing = HttpCallTiming(method, request_url_str)
+    # 配置了导出时每次尝试一个client span, 下游收到的traceparent以它为父span
+    client_span = (
+        start_span(
+            f"HTTP {method}", {"http.method": method, "http.url": request_url_str}
+        )
+        if tracing_enabled()
+        else None
+    )
+    headers = dict(headers) if headers else {}
+    inject_trace_headers(headers, client_span)
+    status_code = None
+    error = None
     try:
-        async with httpx.AsyncClient(proxy=proxies) as client:
-            request_url_str = url_append_query(url, query)
-
-            if verbose:
-                request_log = [f"方法: {method}", f"URL: {request_url_str}"]
-                if data is not None:
-                    request_log.append(f"data: {data}")
-                if json is not None:
-                    request_log.append(f"json: {json}")
-                if headers is not None:
-                    request_log.append(f"请求头: {headers}")
-                Log.debug(f"http 调用, {', '.join(request_log)}")
-
-            if data is not None and json is not None:
-                raise HttpException(
-                    "data and json parameters can not be used at the same time"
+        if client is None and proxies is not None:
+            async with httpx.AsyncClient(proxy=proxies) as proxy_client:
+                response = await proxy_client.request(
+                    method,
+                    request_url_str,
+                    json=json,
+                    data=data,
+                    headers=headers,
+                    timeout=timeout,
+                    extensions=timing.extensions,
                 )
-
+        else:
             response = await client.request(
                 method,
                 request_url_str,
@@ -119,88 +131,191 @@ async def http_invoke(
                 data=data,
                 headers=headers,
                 timeout=timeout,
+                extensions=timing.extensions,
             )
+        timing.body_read()
+        status_code = response.status_code
 
-            response_headers = response.headers
+        response_headers = response.headers
+        if accept_not_modified and response.status_code == 304:
+            return RawResponse(response_headers, None, response.status_code)
 
-            valid_status = validate_status or default_valid_status
-            if not valid_status(response.status_code):
-                raise HttpException(
-                    message=f"响应状态码为 {response.status_code}",
-                    status_code=response.status_code,
-                    body=response.text,
-                )
-            if response_type == "json":
-                resp = response.json()
-            elif response_type == "text":
-                resp = response.text
-            else:
-                raise HttpException(f"不支持的响应类型{response_type}")
-            if verbose:
-                Log.debug(f"resp: {resp}")
-            return RawResponse(response_headers, resp, response.status_code)
+        valid_status = validate_status or default_valid_status
+        if not valid_status(response.status_code):
+            raise HttpException(
+                message=f"响应状态码为 {response.status_code}",
+                status_code=response.status_code,
+                body=response.text,
+            )
+        if response_type == "json":
+            resp = response.json()
+        elif response_type == "text":
+            resp = response.text
+        else:
+            raise HttpException(f"不支持的响应类型{response_type}")
+        timing.decoded()
+        if verbose and default_logger.isEnabledFor(logging.DEBUG):
+            Log.debug(f"resp: {resp}")
+        return RawResponse(response_headers, resp, response.status_code)
     except Exception as e:
+        error = e
         if isinstance(e, HttpException):
             raise
         else:
             raise HttpException(f"http 调用 {request_url_str} 失败", cause=e)
+    finally:
+        timing.finish(status_code, error)
+        record_http_timing(timing, verbose)
+        if client_span is not None:
+            client_span.set_attribute("http.status_code", status_code)
+            client_span.end(error)
 
 
-async def download_file(
-    url: str, save_path, delete_if_exists: bool = False, verbose: bool = True
-):
-    if not url:
-        raise HttpException("download url is empty")
+async def http_invoke(
+    url: str,
+    method: Literal["GET", "POST", "DELETE", "PUT", "HEAD", "OPTIONS"] = "GET",
+    query: Optional[dict[str, Any]] = None,
+    json: Any = None,
+    data: Any = None,
+    response_type: Literal["json", "text"] = "json",
+    headers: Optional[dict[str, str]] = None,
+    timeout: int = 30,
+    verbose: bool = True,
+    validate_status: Optional[Callable[[int], bool]] = default_valid_status,
+    proxies: Optional[ProxiesTypes] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    pool_name: str = DEFAULT_POOL_NAME,
+    retry: Optional["RetryPolicy"] = None,
+    circuit_breaker: Optional["CircuitBreaker"] = None,
+    cache: Optional["ResponseCache"] = None,
+    rate_limit: bool = True,
+) -> RawResponse:
+    """
+    client: 指定使用的httpx.AsyncClient, 优先级高于pool_name
+    pool_name: 使用HttpClientPool中的哪个连接池, 默认共享default连接池
+    proxies: 代理是client级别的配置, 指定代理时会使用一次性的client
+    retry: 重试策略, 为None时不重试
+    circuit_breaker: 熔断器, 上游不健康时直接抛出CircuitOpenException, 不再等待timeout
+    cache: GET请求的响应缓存, 为None时不缓存
+    rate_limit: 是否使用RateLimiterRegistry中为该host/路径配置的限流, 排队超时抛出RateLimitExceededException
+    """
+    request_url_str = url_append_query(url, query)
 
-    if not save_path:
-        raise HttpException("save path is empty")
+    if verbose and default_logger.isEnabledFor(logging.DEBUG):
+        request_log = [f"方法: {method}", f"URL: {request_url_str}"]
+        if data is not None:
+            request_log.append(f"data: {data}")
+        if json is not None:
+            request_log.append(f"json: {json}")
+        if headers is not None:
+            request_log.append(f"请求头: {headers}")
+        Log.debug(f"http 调用, {', '.join(request_log)}")
 
-    exists = os.path.exists(save_path)
-    is_file = os.path.isfile(save_path)
-    if not delete_if_exists and exists and is_file:
-        if verbose:
-            Log.info(f"download url[{url}] to path[{save_path}], file exists, skip")
-        return
+    if data is not None and json is not None:
+        raise HttpException("data and json parameters can not be used at the same time")
 
-    if exists:
-        try:
-            if is_file:
-                os.remove(save_path)
-            else:
-                shutil.rmtree(save_path)
-        except Exception as e:
-            raise HttpException(f"delete file[{save_path}] error", e)
+    headers = dict(headers) if headers else {}
+    trace_context.patch_http_invoke(headers)
 
-    await asyncio.sleep(1)
-    temp_file_path = f"{save_path}.temp"
+    host = url_host(request_url_str)
+    limiter = RateLimiterRegistry.match(request_url_str) if rate_limit else None
+    if retry is not None and retry.budget is not None:
+        retry.budget.deposit()
 
-    async with httpx.AsyncClient() as client:
-        try:
-            async with client.stream("GET", url) as response:
-                if response.status_code != 200:
-                    raise HttpException(
-                        f"download url[{url}] error, status[{response.status_code}]"
+    async def send(
+        request_headers: Optional[dict[str, str]], accept_not_modified: bool = False
+    ) -> RawResponse:
+        attempt = 0
+        while True:
+            async with limiter.limit() if limiter is not None else nullcontext():
+                if circuit_breaker is not None:
+                    circuit_breaker.before_call(host)
+                recorded = False
+                try:
+                    response = await _invoke_once(
+                        client,
+                        pool_name,
+                        proxies,
+                        method,
+                        request_url_str,
+                        json,
+                        data,
+                        response_type,
+                        request_headers,
+                        timeout,
+                        verbose,
+                        validate_status,
+                        accept_not_modified,
                     )
-                async with aiofiles.open(temp_file_path, "wb") as fd:
-                    async for chunk in response.aiter_bytes(4096):
-                        await fd.write(chunk)
-                    await fd.flush()
-        except Exception as e:
-            if isinstance(e, HttpException):
-                raise e
-            else:
-                raise HttpException(
-                    f"download url[{url}] to path[{save_path}] error", e
-                )
+                except HttpException as e:
+                    if circuit_breaker is not None:
+                        recorded = True
+                        circuit_breaker.record(host, e)
+                    if retry is None or not retry.should_retry(method, attempt, e):
+                        raise
+                    delay = retry.backoff(attempt)
+                    attempt += 1
+                    if verbose:
+                        Log.warn(
+                            f"http 调用 {request_url_str} 失败, {delay:.3f}s后第{attempt}次重试: {e}"
+                        )
+                else:
+                    if circuit_breaker is not None:
+                        recorded = True
+                        circuit_breaker.record(host)
+                    return response
+                finally:
+                    # 被取消或抛出非HttpException时没有结果, 归还半开探测名额
+                    if circuit_breaker is not None and not recorded:
+                        circuit_breaker.release(host)
+            # 退避等待时不占用限流的并发名额
+            await asyncio.sleep(delay)
 
-    # rename temp file to save path
-    try:
-        os.rename(temp_file_path, save_path)
-    except Exception as e:
-        try:
-            os.remove(temp_file_path)
-        except:
-            pass
-        raise HttpException(
-            f"rename temp file[{temp_file_path}] to save path[{save_path}] error", e
-        )
+    if cache is None or method != "GET":
+        return await send(headers)
+    return await _cached_send(
+        cache,
+        send,
+        cache.key("GET", request_url_str, headers, response_type, validate_status),
+        request_url_str,
+        headers,
+        verbose,
+    )
+
+
+async def _cached_send(
+    cache: "ResponseCache",
+    send: Callable[..., Awaitable[RawResponse]],
+    cache_key: "CacheKey",
+    request_url_str: str,
+    headers: Optional[dict[str, str]],
+    verbose: bool,
+) -> RawResponse:
+    entry = cache.get(cache_key)
+    if entry is not None and entry.is_fresh(time.monotonic()):
+        cache.hits += 1
+        if verbose:
+            Log.debug("http 调用 %s 命中缓存", request_url_str)
+        return cache.copy_response(entry.response)
+    cache.misses += 1
+
+    async def load() -> RawResponse:
+        if entry is None or not entry.can_revalidate():
+            response = await send(headers)
+            cache.put(cache_key, response)
+            return response
+        conditional_headers = dict(headers or {})
+        if entry.etag is not None:
+            conditional_headers["If-None-Match"] = entry.etag
+        if entry.last_modified is not None:
+            conditional_headers["If-Modified-Since"] = entry.last_modified
+        response = await send(conditional_headers, accept_not_modified=True)
+        if response.status_code == 304:
+            cache.revalidations += 1
+            cache.refresh(cache_key, entry, response.headers)
+            return entry.response
+        cache.put(cache_key, response)
+        return response
+
+    # 并发等待者与缓存共享load的结果, 每个调用方拿到自己的副本
+    return cache.copy_response(await cache.coalesce(cache_key, load))
@@ -0,0 +1,100 @@
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from clio.logger import Log
+
+DEFAULT_POOL_NAME = "default"
+
+
+class HttpClientPool:
+    """
+    进程内共享的httpx.AsyncClient注册表, 每个pool一个长连接client,
+    httpx内部按host维护连接池并复用keep-alive连接, 避免每次调用都重新做TCP+TLS握手
+    """
+
+    _pool_configs: Dict[str, Dict[str, Any]] = {}
+    _clients: Dict[str, httpx.AsyncClient] = {}
+
+    @staticmethod
+    def configure(
+        pool_name: str = DEFAULT_POOL_NAME,
+        max_connections: Optional[int] = 100,
+        max_keepalive_connections: Optional[int] = 20,
+        keepalive_expiry: Optional[float] = 5.0,
+        timeout: float = 30,
+        http2: bool = False,
+        **client_kwargs: Any,
+    ):
+        """
+        Configure a pool, must be called before the pool's client is created.
+
+        http2: 开启后同一host的并发请求复用一个多路复用的HTTP/2连接,
+            https通过ALPN协商, 上游不支持时自动回退到HTTP/1.1,
+            明文h2c需要同时传入http1=False,
+            需要安装h2(pip install httpx[http2]), 未安装时回退到HTTP/1.1
+        """
+        if pool_name in HttpClientPool._clients:
+            raise ValueError(
+                f"http client pool[{pool_name}] already started, configure it before use"
+            )
+        if http2 and importlib.util.find_spec("h2") is None:
+            Log.warn(
+                f"http client pool[{pool_name}] http2 disabled, "
+                f"package h2 is not installed, run `pip install httpx[http2]`"
+            )
+            http2 = False
+            client_kwargs.pop("http1", None)
+        HttpClientPool._pool_configs[pool_name] = {
+            "http2": http2,
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            "timeout": timeout,
+            **client_kwargs,
+        }
+
+    @staticmethod
+    def get_client(pool_name: str = DEFAULT_POOL_NAME) -> httpx.AsyncClient:
+        """Get the client of the pool, create it lazily if it does not exist."""
+        client = HttpClientPool._clients.get(pool_name)
+        if client is None or client.is_closed:
+            if pool_name not in HttpClientPool._pool_configs:
+                HttpClientPool.configure(pool_name)
+            config = HttpClientPool._pool_configs[pool_name]
+            client = httpx.AsyncClient(**config)
+            HttpClientPool._clients[pool_name] = client
+        return client
+
+    @staticmethod
+    async def start():
+        """Create clients of all configured pools."""
+        if DEFAULT_POOL_NAME not in HttpClientPool._pool_configs:
+            HttpClientPool.configure(DEFAULT_POOL_NAME)
+        for pool_name in HttpClientPool._pool_configs:
+            HttpClientPool.get_client(pool_name)
+
+    @staticmethod
+    async def close():
+        """Close all clients and release their connections."""
+        clients = list(HttpClientPool._clients.items())
+        HttpClientPool._clients.clear()
+        for pool_name, client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                Log.error(f"close http client pool[{pool_name}] error: {e}")
+
+
+@asynccontextmanager
+async def http_client_lifespan(app: Any = None) -> AsyncIterator[None]:
+    """FastAPI lifespan, start the http client pools on startup and close them on shutdown."""
+    await HttpClientPool.start()
+    try:
+        yield
+    finally:
+        await HttpClientPool.close()
@@ -0,0 +1,248 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import ParseResult, urlparse
+
+from clio.metrics import MetricsRegistry
+
+from .exception import RateLimitExceededException
+
+_limiter_queue_depth = MetricsRegistry.gauge(
+    "clio_rate_limiter_queue_depth",
+    "限流器中正在排队的请求数",
+    label_names=("limiter",),
+)
+_limiter_in_flight = MetricsRegistry.gauge(
+    "clio_rate_limiter_in_flight",
+    "限流器放行后正在执行的请求数",
+    label_names=("limiter",),
+)
+_limiter_wait = MetricsRegistry.histogram(
+    "clio_rate_limiter_wait_seconds",
+    "请求在限流器中排队等待的时间",
+    label_names=("limiter",),
+)
+_limiter_rejected_total = MetricsRegistry.counter(
+    "clio_rate_limiter_rejected_total",
+    "队列已满被直接拒绝的请求数",
+    label_names=("limiter",),
+)
+_limiter_timeouts_total = MetricsRegistry.counter(
+    "clio_rate_limiter_timeouts_total",
+    "排队超时的请求数",
+    label_names=("limiter",),
+)
+
+
+def _parts_host(url_parts: ParseResult) -> str:
+    host = url_parts.hostname or ""
+    if ":" in host:
+        # ipv6
+        host = f"[{host}]"
+    try:
+        port = url_parts.port
+    except ValueError:
+        port = None
+    return f"{host}:{port}" if port is not None else host
+
+
+def url_host(url: str) -> str:
+    """
+    url中的host[:port], 不包含netloc中的用户名与密码,
+    用作限流, 熔断, 并发控制与指标标签的key, 避免凭证出现在指标与日志中
+    """
+    return _parts_host(urlparse(url))
+
+
+class RateLimiter:
+    """
+    令牌桶限流 + 最大并发数, 超出时在有界队列中排队等待
+
+    rate: 每秒允许的请求数, 为None时不限速
+    burst: 令牌桶容量, 允许的突发请求数, 默认与rate相同
+    max_in_flight: 最大并发请求数, 为None时不限制
+    max_queue: 最多排队的请求数, 队列满时直接抛出RateLimitExceededException
+    queue_timeout: 排队的最长时间, 秒, 超时抛出RateLimitExceededException
+    """
+
+    def __init__(
+        self,
+        key: str,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        max_queue: int = 1000,
+        queue_timeout: float = 10.0,
+    ):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        if max_in_flight is not None and max_in_flight <= 0:
+            raise ValueError("max_in_flight must be greater than 0")
+        self.key = key
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate or 1))
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._semaphore = (
+            asyncio.Semaphore(max_in_flight) if max_in_flight is not None else None
+        )
+        # metrics
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._queue_depth_gauge = _limiter_queue_depth.labels(key)
+        self._in_flight_gauge = _limiter_in_flight.labels(key)
+        self._wait_histogram = _limiter_wait.labels(key)
+        self._rejected_counter = _limiter_rejected_total.labels(key)
+        self._timeouts_counter = _limiter_timeouts_total.labels(key)
+
+    def _reserve(self, max_delay: float) -> float:
+        """
+        预约一个令牌, 返回需要等待的时间, 令牌可以透支为负数, 后来者按顺序等待更久
+        需要等待的时间超过max_delay时不预约, 返回-1
+        """
+        if self.rate is None:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.burst), self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+        delay = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+        if delay > max_delay:
+            return -1
+        self._tokens -= 1
+        return delay
+
+    def _record_wait(self, wait: float):
+        self._wait_histogram.observe(wait)
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    @asynccontextmanager
+    async def limit(self) -> AsyncIterator[None]:
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            self._rejected_counter.inc()
+            raise RateLimitExceededException(
+                self.key, f"queue is full, depth {self.queue_depth}"
+            )
+        start = time.monotonic()
+        self.queue_depth += 1
+        self._queue_depth_gauge.inc()
+        acquired_semaphore = False
+        try:
+            if self._semaphore is not None:
+                try:
+                    await asyncio.wait_for(
+                        self._semaphore.acquire(), timeout=self.queue_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    self._timeouts_counter.inc()
+                    raise RateLimitExceededException(
+                        self.key,
+                        f"wait for in-flight slot over {self.queue_timeout}s",
+                    )
+                acquired_semaphore = True
+            remaining = self.queue_timeout - (time.monotonic() - start)
+            delay = self._reserve(max(remaining, 0))
+            if delay < 0:
+                self.timeouts += 1
+                self._timeouts_counter.inc()
+                raise RateLimitExceededException(
+                    self.key, f"wait for token over {self.queue_timeout}s"
+                )
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            if acquired_semaphore and self._semaphore is not None:
+                self._semaphore.release()
+            raise
+        finally:
+            self.queue_depth -= 1
+            self._queue_depth_gauge.dec()
+            self._record_wait(time.monotonic() - start)
+
+        self.acquired += 1
+        self.in_flight += 1
+        self._in_flight_gauge.inc()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._in_flight_gauge.dec()
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def stats(self) -> Dict[str, float]:
+        waited = self.acquired + self.timeouts
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait": self.total_wait / waited if waited else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class RateLimiterRegistry:
+    """
+    按host与路径前缀配置的限流器, http_invoke根据url自动匹配, 路径前缀最长的优先
+
+    RateLimiterRegistry.configure("api.partner.com", rate=50, max_in_flight=20)
+    RateLimiterRegistry.configure("api.partner.com", "/v1/search", rate=5)
+    """
+
+    _limiters: Dict[str, List[Tuple[str, RateLimiter]]] = {}
+
+    @staticmethod
+    def configure(host: str, path_prefix: str = "", **kwargs) -> RateLimiter:
+        host = host.lower()
+        key = f"{host}{path_prefix}"
+        limiter = RateLimiter(key, **kwargs)
+        routes = [
+            (prefix, existing)
+            for prefix, existing in RateLimiterRegistry._limiters.get(host, [])
+            if prefix != path_prefix
+        ]
+        routes.append((path_prefix, limiter))
+        routes.sort(key=lambda route: len(route[0]), reverse=True)
+        RateLimiterRegistry._limiters[host] = routes
+        return limiter
+
+    @staticmethod
+    def match(url: str) -> Optional[RateLimiter]:
+        if not RateLimiterRegistry._limiters:
+            return None
+        url_parts = urlparse(url)
+        routes = RateLimiterRegistry._limiters.get(_parts_host(url_parts))
+        if not routes:
+            return None
+        for prefix, limiter in routes:
+            if url_parts.path.startswith(prefix):
+                return limiter
+        return None
+
+    @staticmethod
+    def stats() -> Dict[str, Dict[str, float]]:
+        return {
+            limiter.key: limiter.stats()
+            for routes in RateLimiterRegistry._limiters.values()
+            for _, limiter in routes
+        }
+
+    @staticmethod
+    def clear():
+        RateLimiterRegistry._limiters.clear()
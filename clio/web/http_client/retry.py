@@ -0,0 +1,199 @@
+import random
+import threading
+import time
+from typing import Collection, Optional
+
+import httpx
+
+from .exception import CircuitOpenException, HttpException
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUS = frozenset({429, 502, 503, 504})
+
+
+class RetryBudget:
+    """
+    重试预算, 限制重试请求占总请求的比例, 避免上游故障时重试把流量放大
+    每次请求存入ratio个token, 每次重试消耗1个token, 另外每秒固定补充min_retries_per_second个token
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_retries_per_second: float = 5.0,
+        max_tokens: float = 100.0,
+    ):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(
+            self.max_tokens, self._tokens + elapsed * self.min_retries_per_second
+        )
+
+    def deposit(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    http_invoke的重试策略, 指数退避 + full jitter
+
+    max_retries: 最大重试次数, 不包含第一次请求
+    backoff_base: 第n次重试前等待 [0, backoff_base * 2^n] 之间的随机时间
+    backoff_max: 单次等待时间上限
+    methods: 允许重试的方法, 默认只重试幂等方法
+    retry_status: 需要重试的响应状态码
+    budget: 重试预算, 多个RetryPolicy可以共用同一个预算
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0,
+        jitter: bool = True,
+        methods: Collection[str] = IDEMPOTENT_METHODS,
+        retry_status: Collection[int] = RETRYABLE_STATUS,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.methods = frozenset(m.upper() for m in methods)
+        self.retry_status = frozenset(retry_status)
+        self.budget = budget
+
+    def is_retryable_error(self, error: HttpException) -> bool:
+        if isinstance(error, CircuitOpenException):
+            return False
+        if error.status_code is not None:
+            return error.status_code in self.retry_status
+        return isinstance(error.cause, httpx.TransportError)
+
+    def should_retry(self, method: str, attempt: int, error: HttpException) -> bool:
+        """attempt: 已经重试的次数"""
+        if attempt >= self.max_retries:
+            return False
+        if method.upper() not in self.methods:
+            return False
+        if not self.is_retryable_error(error):
+            return False
+        if self.budget is not None and not self.budget.withdraw():
+            return False
+        return True
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2**attempt))
+        if self.jitter:
+            return random.uniform(0, delay)
+        return delay
+
+
+class _HostCircuit:
+    __slots__ = ("state", "failures", "opened_at", "half_open_calls")
+
+    def __init__(self):
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+
+
+class CircuitBreaker:
+    """
+    按host统计的熔断器
+    连续失败failure_threshold次后打开, 打开期间直接抛出CircuitOpenException,
+    recovery_timeout秒后进入半开状态, 放行half_open_max_calls个探测请求, 探测成功则关闭
+    探测请求没有结果(被取消或抛出非HttpException)时通过release归还名额,
+    半开状态超过recovery_timeout仍没有结果时也会重新放行探测请求
+    只有传输错误与5xx会被计为失败, 4xx说明上游是健康的
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._circuits: dict[str, _HostCircuit] = {}
+
+    def _circuit(self, host: str) -> _HostCircuit:
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = _HostCircuit()
+            self._circuits[host] = circuit
+        return circuit
+
+    def state(self, host: str) -> str:
+        return self._circuit(host).state
+
+    def before_call(self, host: str):
+        circuit = self._circuit(host)
+        if circuit.state == CircuitBreaker.CLOSED:
+            return
+        now = time.monotonic()
+        if circuit.state == CircuitBreaker.OPEN:
+            retry_after = circuit.opened_at + self.recovery_timeout - now
+            if retry_after > 0:
+                raise CircuitOpenException(host, retry_after)
+            circuit.state = CircuitBreaker.HALF_OPEN
+            circuit.opened_at = now
+            circuit.half_open_calls = 0
+        if circuit.half_open_calls >= self.half_open_max_calls:
+            if now - circuit.opened_at < self.recovery_timeout:
+                raise CircuitOpenException(host, 0)
+            circuit.opened_at = now
+            circuit.half_open_calls = 0
+        circuit.half_open_calls += 1
+
+    def release(self, host: str):
+        """探测请求没有调用record就结束时归还半开状态的名额"""
+        circuit = self._circuit(host)
+        if circuit.state == CircuitBreaker.HALF_OPEN and circuit.half_open_calls > 0:
+            circuit.half_open_calls -= 1
+
+    def is_failure(self, error: Optional[HttpException]) -> bool:
+        if error is None or isinstance(error, CircuitOpenException):
+            return False
+        if error.status_code is not None:
+            return error.status_code >= 500
+        return isinstance(error.cause, httpx.TransportError)
+
+    def record(self, host: str, error: Optional[HttpException] = None):
+        circuit = self._circuit(host)
+        if not self.is_failure(error):
+            circuit.state = CircuitBreaker.CLOSED
+            circuit.failures = 0
+            return
+        circuit.failures += 1
+        if (
+            circuit.state == CircuitBreaker.HALF_OPEN
+            or circuit.failures >= self.failure_threshold
+        ):
+            circuit.state = CircuitBreaker.OPEN
+            circuit.opened_at = time.monotonic()
@@ -0,0 +1,230 @@
+import codecs
+import json as jsonlib
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Callable, List, Literal, Optional
+
+import httpx
+
+from clio.context.trace import trace_context
+from clio.logger import Log
+
+from .exception import HttpException
+from .http_client import default_valid_status, url_append_query
+from .pool import DEFAULT_POOL_NAME, HttpClientPool
+from .rate_limit import RateLimiterRegistry
+from .timing import HttpCallTiming, record_http_timing
+
+DEFAULT_STREAM_CHUNK_SIZE = 64 * 1024
+_ERROR_BODY_LIMIT = 64 * 1024
+
+
+class ResponseTooLargeException(HttpException):
+    """响应体超过max_size, 已中断读取"""
+
+    def __init__(self, url: str, max_size: int, status_code: Optional[int] = None):
+        super().__init__(
+            f"response of {url} exceeds max size {max_size} bytes",
+            status_code=status_code,
+        )
+        self.max_size = max_size
+
+
+class JsonArrayParser:
+    """
+    增量解析顶层为数组的json, 每次feed返回已经完整的元素, 内存中只保留未解析完的部分
+    """
+
+    _EXPECT_VALUE_OR_END = 0
+    _EXPECT_COMMA_OR_END = 1
+    _EXPECT_VALUE = 2
+
+    def __init__(self):
+        self._decoder = jsonlib.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self._finished = False
+        self._expect = JsonArrayParser._EXPECT_VALUE_OR_END
+        # 上次解析失败时缓冲区的大小, 缓冲区翻倍前不再重试, 避免大元素被反复解析
+        self._failed_size = 0
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        self._buffer += self._text_decoder.decode(chunk)
+        if len(self._buffer) < self._failed_size * 2:
+            return []
+        return self._parse(eof=False)
+
+    def close(self) -> List[Any]:
+        self._buffer += self._text_decoder.decode(b"", final=True)
+        items = self._parse(eof=True)
+        if not self._finished:
+            raise ValueError("incomplete json array")
+        return items
+
+    def _parse(self, eof: bool) -> List[Any]:
+        items = []
+        buffer = self._buffer
+        size = len(buffer)
+        pos = 0
+        while not self._finished:
+            while pos < size and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos >= size:
+                break
+            char = buffer[pos]
+            if not self._started:
+                if char != "[":
+                    raise ValueError("response is not a json array")
+                self._started = True
+                pos += 1
+                continue
+            if self._expect != JsonArrayParser._EXPECT_VALUE and char == "]":
+                self._finished = True
+                pos += 1
+                continue
+            if self._expect == JsonArrayParser._EXPECT_COMMA_OR_END:
+                if char != ",":
+                    raise ValueError(f"unexpected char {char!r} in json array")
+                self._expect = JsonArrayParser._EXPECT_VALUE
+                pos += 1
+                continue
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except jsonlib.JSONDecodeError:
+                if eof:
+                    raise
+                self._failed_size = size - pos
+                break
+            if end == size and not eof:
+                # 数字等标量可能还没有结束, 等待更多数据
+                self._failed_size = size - pos
+                break
+            items.append(item)
+            self._expect = JsonArrayParser._EXPECT_COMMA_OR_END
+            self._failed_size = 0
+            pos = end
+        self._buffer = buffer[pos:]
+        return items
+
+
+async def _read_limited(response: httpx.Response, limit: int) -> bytes:
+    body = b""
+    async for chunk in response.aiter_bytes():
+        body += chunk
+        if len(body) >= limit:
+            return body[:limit]
+    return body
+
+
+async def http_stream(
+    url: str,
+    method: Literal["GET", "POST", "DELETE", "PUT", "HEAD", "OPTIONS"] = "GET",
+    query: Optional[dict[str, Any]] = None,
+    json: Any = None,
+    data: Any = None,
+    mode: Literal["bytes", "ndjson", "json_array"] = "bytes",
+    headers: Optional[dict[str, str]] = None,
+    timeout: int = 30,
+    verbose: bool = True,
+    validate_status: Optional[Callable[[int], bool]] = default_valid_status,
+    max_size: Optional[int] = None,
+    chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+    client: Optional[httpx.AsyncClient] = None,
+    pool_name: str = DEFAULT_POOL_NAME,
+    rate_limit: bool = True,
+) -> AsyncIterator[Any]:
+    """
+    流式读取响应, 不会把整个响应体读入内存
+
+    mode: bytes 逐块返回原始字节, ndjson 逐行返回解析后的json, json_array 逐个返回顶层json数组的元素
+    max_size: 响应体的最大字节数, 超出时中断读取并抛出ResponseTooLargeException
+    rate_limit: 是否使用RateLimiterRegistry中为该host/路径配置的限流, 整个读取过程占用一个并发名额
+    """
+    if mode not in ("bytes", "ndjson", "json_array"):
+        raise HttpException(f"不支持的流式响应类型{mode}")
+    request_url_str = url_append_query(url, query)
+    if verbose:
+        Log.debug(f"http 流式调用, 方法: {method}, URL: {request_url_str}")
+    if data is not None and json is not None:
+        raise HttpException("data and json parameters can not be used at the same time")
+    if client is None:
+        client = HttpClientPool.get_client(pool_name)
+    limiter = RateLimiterRegistry.match(request_url_str) if rate_limit else None
+    headers = dict(headers) if headers else {}
+    trace_context.patch_http_invoke(headers)
+    timing = HttpCallTiming(method, request_url_str)
+    status_code = None
+    error = None
+
+    try:
+        async with (
+            limiter.limit() if limiter is not None else nullcontext(),
+            client.stream(
+                method,
+                request_url_str,
+                json=json,
+                data=data,
+                headers=headers,
+                timeout=timeout,
+                extensions=timing.extensions,
+            ) as response,
+        ):
+            status_code = response.status_code
+            valid_status = validate_status or default_valid_status
+            if not valid_status(response.status_code):
+                body = await _read_limited(response, _ERROR_BODY_LIMIT)
+                raise HttpException(
+                    message=f"响应状态码为 {response.status_code}",
+                    status_code=response.status_code,
+                    body=body.decode("utf-8", errors="replace"),
+                )
+            content_length = response.headers.get("content-length")
+            if (
+                max_size is not None
+                and content_length is not None
+                and content_length.isdigit()
+                and int(content_length) > max_size
+            ):
+                raise ResponseTooLargeException(
+                    request_url_str, max_size, response.status_code
+                )
+
+            received = 0
+            line_buffer = b""
+            array_parser = JsonArrayParser() if mode == "json_array" else None
+            async for chunk in response.aiter_bytes(chunk_size):
+                received += len(chunk)
+                if max_size is not None and received > max_size:
+                    raise ResponseTooLargeException(
+                        request_url_str, max_size, response.status_code
+                    )
+                if mode == "bytes":
+                    yield chunk
+                elif mode == "ndjson":
+                    line_buffer += chunk
+                    lines = line_buffer.split(b"\n")
+                    line_buffer = lines.pop()
+                    for line in lines:
+                        if line.strip():
+                            yield jsonlib.loads(line)
+                elif array_parser is not None:
+                    for item in array_parser.feed(chunk):
+                        yield item
+            if mode == "ndjson" and line_buffer.strip():
+                yield jsonlib.loads(line_buffer)
+            elif array_parser is not None:
+                for item in array_parser.close():
+                    yield item
+            timing.body_read()
+            if verbose:
+                Log.debug(f"http 流式调用 {request_url_str} 结束, 共 {received} bytes")
+    except Exception as e:
+        error = e
+        if isinstance(e, HttpException):
+            raise
+        else:
+            raise HttpException(f"http 调用 {request_url_str} 失败", cause=e)
+    finally:
+        # body_read包含调用方处理每个元素的时间
+        timing.finish(status_code, error)
+        record_http_timing(timing, verbose)
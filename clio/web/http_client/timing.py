@@ -0,0 +1,152 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from clio.context import request_context_or_none
+from clio.logger import Log, default_logger
+from clio.metrics import MetricsRegistry
+
+from .rate_limit import url_host
+
+HTTP_TIMINGS = "__http_timings"
+
+_client_requests_total = MetricsRegistry.counter(
+    "clio_http_client_requests_total",
+    "调用上游http接口的次数, 请求失败时status为error",
+    label_names=("host", "method", "status"),
+)
+_client_duration = MetricsRegistry.histogram(
+    "clio_http_client_duration_seconds",
+    "调用上游http接口的耗时",
+    label_names=("host", "method"),
+)
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start) * 1000, 3)
+
+
+class HttpCallTiming:
+    """
+    一次上游调用各阶段的耗时, 通过httpcore的trace扩展采集
+    pool_wait: 等待连接池中可用连接, connect: tcp+tls建连, ttfb: 发送请求头到收到响应头,
+    body_read: 读取响应体, decode: json/text解码, 单位都是毫秒, 复用连接时connect为None
+    """
+
+    __slots__ = (
+        "method",
+        "url",
+        "status_code",
+        "error",
+        "_start",
+        "_connect_start",
+        "_connect_end",
+        "_request_start",
+        "_headers_end",
+        "_body_end",
+        "_decode_end",
+        "_end",
+    )
+
+    def __init__(self, method: str, url: str):
+        self.method = method
+        self.url = url
+        self.status_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+        self._connect_start: Optional[float] = None
+        self._connect_end: Optional[float] = None
+        self._request_start: Optional[float] = None
+        self._headers_end: Optional[float] = None
+        self._body_end: Optional[float] = None
+        self._decode_end: Optional[float] = None
+        self._end: Optional[float] = None
+
+    async def trace(self, event_name: str, info: Dict[str, Any]):
+        """httpx的trace extension"""
+        now = time.perf_counter()
+        if event_name == "connection.connect_tcp.started":
+            self._connect_start = now
+        elif event_name in (
+            "connection.connect_tcp.complete",
+            "connection.start_tls.complete",
+        ):
+            self._connect_end = now
+        elif event_name.endswith(".send_request_headers.started"):
+            if self._request_start is None:
+                self._request_start = now
+        elif event_name.endswith(".receive_response_headers.complete"):
+            self._headers_end = now
+
+    @property
+    def extensions(self) -> Dict[str, Any]:
+        return {"trace": self.trace}
+
+    def body_read(self):
+        self._body_end = time.perf_counter()
+
+    def decoded(self):
+        self._decode_end = time.perf_counter()
+
+    def finish(self, status_code: Optional[int] = None, error: Any = None):
+        self._end = time.perf_counter()
+        self.status_code = status_code
+        if error is not None:
+            self.error = str(error)
+
+    @property
+    def total(self) -> Optional[float]:
+        return _ms(self._start, self._end)
+
+    def to_dict(self) -> Dict[str, Any]:
+        first_io = self._connect_start or self._request_start
+        return {
+            "method": self.method,
+            "url": self.url,
+            "status_code": self.status_code,
+            "error": self.error,
+            "total": self.total,
+            "pool_wait": _ms(self._start, first_io),
+            "connect": _ms(self._connect_start, self._connect_end),
+            "ttfb": _ms(self._request_start, self._headers_end),
+            "body_read": _ms(self._headers_end, self._body_end),
+            "decode": _ms(self._body_end, self._decode_end),
+        }
+
+
+def record_http_timing(timing: HttpCallTiming, verbose: bool = True):
+    """保存到当前请求上下文, 记录指标, 并以结构化字段输出DEBUG日志"""
+    fields = timing.to_dict()
+    host = url_host(timing.url)
+    status = str(timing.status_code) if timing.status_code is not None else "error"
+    _client_requests_total.labels(host, timing.method, status).inc()
+    if fields["total"] is not None:
+        _client_duration.labels(host, timing.method).observe(fields["total"] / 1000)
+    ctx = request_context_or_none()
+    if ctx is not None:
+        timings = ctx.get(HTTP_TIMINGS)
+        if timings is None:
+            timings = []
+            ctx.set(HTTP_TIMINGS, timings)
+        timings.append(fields)
+    if verbose and default_logger.isEnabledFor(logging.DEBUG):
+        phases = ", ".join(
+            f"{key}={value}ms"
+            for key in ("total", "pool_wait", "connect", "ttfb", "body_read", "decode")
+            if (value := fields[key]) is not None
+        )
+        Log.debug(
+            f"http 调用耗时 {timing.method} {timing.url} "
+            f"status={timing.status_code}, {phases}",
+            **fields,
+        )
+
+
+def current_http_timings() -> List[Dict[str, Any]]:
+    """当前请求中所有上游调用的耗时"""
+    ctx = request_context_or_none()
+    if ctx is None:
+        return []
+    return ctx.get(HTTP_TIMINGS) or []
@@ -1,7 +1,22 @@
-from typing import Generic, Optional, TypeVar
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Generic,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    TypeVar,
+    Union,
+)
 
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, StreamingResponse
+
+from clio.logger import Log
 from clio.pydantics import BaseModel, Field
-from clio.utils import object_to_json
+from clio.utils import JsonSerializer, object_to_json
 
 T = TypeVar("T")
 
@@ -19,9 +34,125 @@ class HttpResponse(BaseModel, Generic[T]):
     def failure(cls, code: int, message: str):
         return cls(code=code, message=message, data=None)
 
+    @classmethod
+    def stream(
+        cls,
+        data: Union[Iterable[Any], AsyncIterable[Any]],
+        **kwargs: Any,
+    ) -> "StreamingHttpResponse":
+        """data为同步或异步迭代器, 逐个编码后分块返回, 参数见StreamingHttpResponse"""
+        return StreamingHttpResponse(data, **kwargs)
+
     def to_json(self) -> dict:
         return {
             "code": self.code,
             "message": self.message,
             "data": object_to_json(self.data) if self.data is not None else None,
         }
+
+    def _json_encode(self) -> dict:
+        # JsonSerializer使用的钩子, data由序列化器继续递归编码, 不像to_json那样先单独编码一次
+        return {
+            "code": self.code,
+            "message": self.message,
+            "data": self.data,
+        }
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    使用JsonSerializer(orjson/msgspec/json)直接编码为bytes, 可以直接传入HttpResponse, pydantic模型,
+    dataclass, SQLAlchemy对象等, 不经过jsonable_encoder
+
+    return FastJSONResponse(HttpResponse.success(rows))
+    """
+
+    def render(self, content: Any) -> bytes:
+        return JsonSerializer.dumps(content)
+
+
+DEFAULT_STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class StreamingHttpResponse(StreamingResponse):
+    """
+    流式返回HttpResponse, 先输出 {"code":0,"message":"","data":[ , 再逐个编码data中的元素,
+    攒够buffer_size字节后发送一块, 内存占用与总行数无关, 适合导出等返回大量数据的接口
+
+    data: 同步或异步迭代器, 同步迭代器在线程池中迭代与编码, 每块切换一次线程, 不阻塞事件循环
+    开始发送后出错时状态码已经无法修改, 记录日志并中断响应, 客户端会收到不完整的json
+
+    @router.get("/orders/export")
+    async def export():
+        return HttpResponse.stream(query_orders_iter())
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        data: Union[Iterable[Any], AsyncIterable[Any]],
+        code: int = 0,
+        message: str = "",
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        buffer_size: int = DEFAULT_STREAM_BUFFER_SIZE,
+        background: Optional[BackgroundTask] = None,
+    ):
+        self.buffer_size = buffer_size
+        self._prefix = (
+            b'{"code":'
+            + JsonSerializer.dumps(code)
+            + b',"message":'
+            + JsonSerializer.dumps(message)
+            + b',"data":['
+        )
+        if isinstance(data, AsyncIterable):
+            content = self._aiter_chunks(data)
+        else:
+            content = self._iter_chunks(data)
+        super().__init__(
+            content, status_code=status_code, headers=headers, background=background
+        )
+
+    def _iter_chunks(self, data: Iterable[Any]) -> Iterator[bytes]:
+        buffer = bytearray(self._prefix)
+        dumps = JsonSerializer.dumps
+        buffer_size = self.buffer_size
+        first = True
+        try:
+            for item in data:
+                if first:
+                    first = False
+                else:
+                    buffer += b","
+                buffer += dumps(item)
+                if len(buffer) >= buffer_size:
+                    yield bytes(buffer)
+                    buffer.clear()
+        except Exception as e:
+            Log.error(f"streaming response error: {e}")
+            raise
+        buffer += b"]}"
+        yield bytes(buffer)
+
+    async def _aiter_chunks(self, data: AsyncIterable[Any]) -> AsyncIterator[bytes]:
+        buffer = bytearray(self._prefix)
+        dumps = JsonSerializer.dumps
+        buffer_size = self.buffer_size
+        first = True
+        try:
+            async for item in data:
+                if first:
+                    first = False
+                else:
+                    buffer += b","
+                buffer += dumps(item)
+                if len(buffer) >= buffer_size:
+                    yield bytes(buffer)
+                    buffer.clear()
+        except Exception as e:
+            Log.error(f"streaming response error: {e}")
+            raise
+        buffer += b"]}"
+        yield bytes(buffer)
@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from clio.metrics import PROMETHEUS_CONTENT_TYPE, MetricsRegistry
+
+
+def metrics_router(
+    path: str = "/metrics", include_in_schema: bool = False
+) -> APIRouter:
+    """
+    Prometheus抓取接口, app.include_router(metrics_router())
+    开启多进程聚合时返回所有worker合并后的指标
+    """
+    router = APIRouter()
+
+    # 多进程聚合时需要读取所有worker的文件, 普通函数由FastAPI放到线程池执行, 不阻塞事件循环
+    @router.get(path, include_in_schema=include_in_schema)
+    def metrics():
+        return Response(
+            content=MetricsRegistry.render(), media_type=PROMETHEUS_CONTENT_TYPE
+        )
+
+    return router
@@ -1,11 +1,33 @@
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+import time
+from contextlib import nullcontext
+
+from starlette.datastructures import MutableHeaders
 from starlette.requests import Request
-from starlette.responses import Response
-from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from clio import TraceContext
-from clio.context import RequestContext, request_context_manager
+from clio.context import (
+    RequestContext,
+    request_context_manager,
+    span,
+    tracing_enabled,
+)
 from clio.context.trace import trace_context
+from clio.metrics import MetricsRegistry
+
+_requests_total = MetricsRegistry.counter(
+    "clio_http_requests_total",
+    "处理的http请求数",
+    label_names=("method", "route", "status"),
+)
+_request_duration = MetricsRegistry.histogram(
+    "clio_http_request_duration_seconds",
+    "http请求的处理时间",
+    label_names=("method", "route"),
+)
+_requests_in_progress = MetricsRegistry.gauge(
+    "clio_http_requests_in_progress", "正在处理的http请求数"
+)
 
 
 class RawContextMiddleware:
@@ -23,16 +45,83 @@ class RawContextMiddleware:
         request = Request(scope, receive, send)
         request_context = RequestContext(request)
         trace_context.parse_trace_id(scope, context=request_context)
-        with request_context_manager(request_context):
-            await self.app(scope, receive, send)
+        if scope["type"] != "http":
+            with request_context_manager(request_context):
+                await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start_time = time.perf_counter()
+        method = scope["method"]
+        route_path = "unmatched"
+        _requests_in_progress.labels().inc()
+        # 请求的根span, 父span为请求头traceparent中的上游span,
+        # 没有配置span导出时不创建span, 下游调用透传请求头中的traceparent
+        server_scope = (
+            span("http.server", **{TraceContext.X_TRACE_ID: request_context.trace_id})
+            if tracing_enabled()
+            else nullcontext()
+        )
+        try:
+            with request_context_manager(request_context), server_scope as server_span:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    # 路由匹配后scope中有route, 用路由模板作为标签, 避免路径参数导致标签过多
+                    route = scope.get("route")
+                    route_path = getattr(route, "path", None) or "unmatched"
+                    if server_span is not None:
+                        server_span.name = f"{method} {route_path}"
+                        server_span.attributes.update(
+                            {
+                                "http.method": method,
+                                "http.route": route_path,
+                                "http.status_code": status_code,
+                            }
+                        )
+        finally:
+            _requests_in_progress.labels().dec()
+            _requests_total.labels(method, route_path, str(status_code)).inc()
+            _request_duration.labels(method, route_path).observe(
+                time.perf_counter() - start_time
+            )
+
+
+class HttpMiddleware:
+    """
+    在响应头中加入x-trace-id
+    纯ASGI实现, 在http.response.start消息中加header, 不像BaseHTTPMiddleware那样为每个请求额外创建task与内存流,
+    不影响StreamingResponse与BackgroundTasks
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+    ):
+        self.app = app
 
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-class HttpMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self, request: Request, call_next: RequestResponseEndpoint
-    ) -> Response:
         trace_id = trace_context.trace_id()
-        response = await call_next(request)
-        if trace_id:
-            response.headers.update({TraceContext.X_TRACE_ID: trace_id})
-        return response
+        if not trace_id:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                headers = MutableHeaders(scope=message)
+                headers[TraceContext.X_TRACE_ID] = trace_id
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,70 +1,131 @@
+import functools
+from typing import Dict, Optional
+
 from fastapi.exceptions import RequestValidationError
-from starlette.responses import JSONResponse
+from starlette.responses import Response
 from starlette.status import (
     HTTP_200_OK,
     HTTP_404_NOT_FOUND,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
 
-from ..logger import Log
+from ..logger import SamplingFilter, default_logger
+from ..metrics import MetricsRegistry
+from ..utils import JsonSerializer
 from .exception.business_exception import BusinessException
 from .exception.rpc_exception import RpcException
-from .http_response import HttpResponse
+
+_errors_total = MetricsRegistry.counter(
+    "clio_errors_total",
+    "异常处理器处理的错误数, code为BusinessException的错误码或http状态码",
+    label_names=("type", "code"),
+)
+
+# 异常处理器的日志, 输出到clio的handler, 单独采样, 错误风暴时不会拖慢请求
+_error_logger = default_logger.getChild("errors")
+
+# 错误码对应的响应体前缀 {"code":404,"message":
+_ERROR_PREFIXES: Dict[int, bytes] = {}
+_MAX_ERROR_PREFIXES = 1024
+_ERROR_SUFFIX = b',"data":null}'
+_JSON_MEDIA_TYPE = "application/json"
+# 404响应体中路径的最大长度
+_MAX_NOT_FOUND_PATH = 256
+
+
+def _render_error(code: int, message: str) -> bytes:
+    """直接生成HttpResponse.failure(code, message)的json, 不创建pydantic模型"""
+    prefix = _ERROR_PREFIXES.get(code)
+    if prefix is None:
+        prefix = b'{"code":' + JsonSerializer.dumps(code) + b',"message":'
+        if len(_ERROR_PREFIXES) < _MAX_ERROR_PREFIXES:
+            _ERROR_PREFIXES[code] = prefix
+    return prefix + JsonSerializer.dumps(message) + _ERROR_SUFFIX
+
+
+@functools.lru_cache(maxsize=1024)
+def _not_found_body(path: str) -> bytes:
+    # 探测器与爬虫反复请求的路径(favicon.ico, robots.txt等)直接使用缓存的响应体,
+    # 只按截断后的路径缓存, 不包含query, 缓存占用的内存有上限
+    return _render_error(HTTP_404_NOT_FOUND, f"404 not found: {path}")
+
+
+def _error_response(body: bytes, status_code: int = HTTP_200_OK) -> Response:
+    return Response(body, status_code=status_code, media_type=_JSON_MEDIA_TYPE)
+
+
+def _set_log_sampler(sampler: Optional[SamplingFilter]):
+    for f in list(_error_logger.filters):
+        if isinstance(f, SamplingFilter):
+            _error_logger.removeFilter(f)
+            f.close()
+    if sampler is not None:
+        _error_logger.addFilter(sampler)
 
 
 def common_exception_handlers(
     server_error_code: int = 500,
     rpc_error_code: int = 500,
+    log_rate: Optional[float] = 10.0,
+    log_burst: int = 50,
 ):
+    """
+    log_rate/log_burst: 每个异常处理器每秒最多输出log_rate条错误日志, 允许log_burst条突发,
+        被丢弃的日志数量定期汇总输出, log_rate为None时不限制
+    错误响应直接编码为bytes, 只有RpcException的日志带异常堆栈
+    """
     exception_handlers = {}
+    _set_log_sampler(
+        SamplingFilter(rate=log_rate, burst=log_burst) if log_rate is not None else None
+    )
+
+    not_found_errors = _errors_total.labels("not_found", str(HTTP_404_NOT_FOUND))
+    validation_errors = _errors_total.labels(
+        "validation", str(HTTP_422_UNPROCESSABLE_ENTITY)
+    )
+    rpc_errors = _errors_total.labels("rpc", str(rpc_error_code))
+    server_errors = _errors_total.labels("server", str(server_error_code))
 
     async def not_found_error_handler(request, exc):
-        url = request.url
-        msg = f"404 not found: {url}"
-        Log.error(msg, exc_info=False)
-        return JSONResponse(
-            status_code=HTTP_404_NOT_FOUND,
-            content=HttpResponse.failure(HTTP_404_NOT_FOUND, msg),
-        )
+        url = str(request.url)
+        not_found_errors.inc()
+        _error_logger.error("404 not found: %s", url)
+        path = request.scope["path"][:_MAX_NOT_FOUND_PATH]
+        return _error_response(_not_found_body(path), HTTP_404_NOT_FOUND)
 
     exception_handlers[404] = not_found_error_handler
 
     async def request_validation_error(request, exc: RequestValidationError):
         error_msg = str(exc)
-        Log.error(f"request validation error: {error_msg}")
-        return JSONResponse(
-            status_code=HTTP_422_UNPROCESSABLE_ENTITY,
-            content=HttpResponse.failure(HTTP_422_UNPROCESSABLE_ENTITY, error_msg),
+        validation_errors.inc()
+        _error_logger.error("request validation error: %s", error_msg)
+        return _error_response(
+            _render_error(HTTP_422_UNPROCESSABLE_ENTITY, error_msg),
+            HTTP_422_UNPROCESSABLE_ENTITY,
         )
 
     exception_handlers[RequestValidationError] = request_validation_error
 
     async def business_error_handler(request, exc: BusinessException):
-        Log.error(f"business error: {exc}")
-        return JSONResponse(
-            status_code=HTTP_200_OK,
-            content=HttpResponse.failure(exc.code, exc.message),
-        )
+        _errors_total.labels("business", str(exc.code)).inc()
+        _error_logger.error("business error: %s", exc)
+        return _error_response(_render_error(exc.code, exc.message))
 
     exception_handlers[BusinessException] = business_error_handler
 
     async def rpc_error_handler(request, exc: RpcException):
         error_msg = str(exc)
-        Log.error(f"rpc error: {error_msg}")
-        return JSONResponse(
-            status_code=HTTP_200_OK,
-            content=HttpResponse.failure(rpc_error_code, error_msg),
-        )
+        rpc_errors.inc()
+        _error_logger.error("rpc error: %s", error_msg, exc_info=exc)
+        return _error_response(_render_error(rpc_error_code, error_msg))
 
     exception_handlers[RpcException] = rpc_error_handler
 
     async def custom_error_handler(request, exc: Exception):
         error_msg = str(exc)
-        Log.error(f"custom error: {error_msg}", exc_info=False)
-        return JSONResponse(
-            status_code=HTTP_200_OK,
-            content=HttpResponse.failure(server_error_code, error_msg),
-        )
+        server_errors.inc()
+        _error_logger.error("custom error: %s", error_msg)
+        return _error_response(_render_error(server_error_code, error_msg))
 
     exception_handlers[500] = custom_error_handler
     return exception_handlers
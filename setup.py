@@ -45,7 +45,11 @@ setuptools.setup(
     # },
     # include_package_data=True,
     install_requires=install_requires,
-    extras_require={},
+    extras_require={
+        "http2": ["httpx[http2]"],
+        "orjson": ["orjson"],
+        "msgspec": ["msgspec"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",